@@ -0,0 +1,242 @@
+import asyncio
+import datetime
+import glob
+import html
+import json
+import os
+import random
+import time
+
+from browser_use.agent.service import Agent
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import PrivateAttr
+
+
+class _StepTimer:
+    """Notes when the agent's LLM call for each step returns"""
+
+    def __init__(self):
+        self.decided_at = {}  # step number -> time.time()
+
+    async def on_step(self, state, model_output, step_number):
+        self.decided_at[step_number] = time.time()
+
+
+class AgentRecorder:
+    """Saves live agent runs as JSON so they can be replayed without the site or an LLM
+
+    A recording is the agent's history without screenshots, plus per-step
+    timings. `decide_seconds` covers reading the page state and the LLM
+    call, and `act_seconds` covers the browser actions that followed. Each
+    run of a flow is saved to `<directory>/<name>/<timestamp>.json`, so
+    repeated recordings build up a timing distribution.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def timer(self):
+        """Return a step timer whose `on_step` is passed to the Agent as register_new_step_callback"""
+        return _StepTimer()
+
+    def save(self, name, history, timer):
+        data = history.model_dump()
+        for item in data['history']:
+            item['state']['screenshot'] = None
+
+        steps = []
+        for item in history.history:
+            metadata = item.metadata
+            if metadata is None:
+                continue
+            decided_at = timer.decided_at.get(metadata.step_number, metadata.step_end_time)
+            steps.append({
+                'step': metadata.step_number,
+                'decide_seconds': decided_at - metadata.step_start_time,
+                'act_seconds': metadata.step_end_time - decided_at,
+                'input_tokens': metadata.input_tokens,
+            })
+
+        now = datetime.datetime.now()
+        path = os.path.join(self.directory, name, now.strftime('%Y%m%dT%H%M%S%f') + '.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'name': name, 'recorded_at': now.isoformat(), 'steps': steps, **data}, f, indent=2)
+        print(f"Recorded {len(steps)} agent steps for {name} to {path}")
+        return path
+
+
+# Actions whose element must be a <select> on the replay page
+DROPDOWN_ACTIONS = ('get_dropdown_options', 'select_dropdown_option')
+
+
+class ReplayChatModel(BaseChatModel):
+    """Chat model that answers an Agent with a recorded run's model outputs, in order
+
+    The agent's structured output calls get the next recorded output,
+    validated against the agent's own output schema, after waiting the
+    matching entry of `delays` if one is given. Plain calls come from the
+    extract_content action and get a fixed reply.
+    """
+
+    outputs: list
+    delays: list = []
+    model_name: str = 'replay'
+    _next: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self):
+        return 'replay'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(content='Page content is not recorded; see the replayed model outputs.')
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def with_structured_output(self, schema, include_raw=False, **kwargs):
+        async def answer(messages):
+            index = self._next
+            if index >= len(self.outputs):
+                raise ValueError(f"The recording has only {len(self.outputs)} model outputs")
+            self._next += 1
+            if index < len(self.delays):
+                await asyncio.sleep(self.delays[index])
+            output = self.outputs[index]
+            parsed = schema.model_validate(output)
+            if not include_raw:
+                return parsed
+            return {'raw': AIMessage(content=json.dumps(output)), 'parsed': parsed, 'parsing_error': None}
+
+        return RunnableLambda(answer)
+
+
+def replay_page(outputs):
+    """HTML with an interactive element for every element index the recorded actions use
+
+    browser-use numbers visible interactive elements in document order, so
+    element N on this page is the Nth one. Indexes used with dropdown
+    actions get a <select> holding the recorded option texts; the rest get
+    text inputs, which can be both clicked and typed into.
+    """
+    options = {}
+    highest = -1
+    for output in outputs:
+        for action in output.get('action', []):
+            for name, params in action.items():
+                index = params.get('index') if isinstance(params, dict) else None
+                if index is None:
+                    continue
+                highest = max(highest, index)
+                if name in DROPDOWN_ACTIONS:
+                    options.setdefault(index, set())
+                    if params.get('text'):
+                        options[index].add(params['text'])
+
+    elements = []
+    for index in range(highest + 1):
+        if index in options:
+            choices = ''.join(f"<option>{html.escape(text)}</option>" for text in sorted(options[index]) or ['-'])
+            elements.append(f'<select aria-label="element {index}">{choices}</select>')
+        else:
+            elements.append(f'<input aria-label="element {index}">')
+    return ('<!DOCTYPE html><html><head><title>Agent replay</title><style>'
+            'body{margin:0;display:flex;flex-wrap:wrap}input,select{width:40px;height:14px;margin:1px;padding:0}'
+            '</style></head><body>' + ''.join(elements) + '</body></html>')
+
+
+class AgentReplayer:
+    """Replays recorded agent runs through a real Agent on a local page
+
+    Each run picks one of the flow's recordings and runs the Agent with the
+    caller's task and Controller on a context from `pool`, with a
+    ReplayChatModel standing in for the LLM. Every request the context makes
+    is answered with a replay_page instead of the network, so the recorded
+    actions really execute against a browser but no site or LLM is used.
+    Callers parse the returned history exactly as they would a live one.
+
+    Recorded step timings are an optional latency model. With a positive
+    `time_scale` the model waits each step's decide time and the step waits
+    its act time before acting, both multiplied by `time_scale` and by a
+    lognormal factor with shape `jitter`, drawn from a generator seeded with
+    `seed`, so replays vary realistically but repeat exactly.
+    """
+
+    def __init__(self, directory, pool, time_scale=0.0, jitter=0.25, seed=0):
+        self.directory = directory
+        self.pool = pool
+        self.time_scale = time_scale
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._listeners = []
+
+    def recordings(self, name):
+        return sorted(glob.glob(os.path.join(self.directory, name, '*.json')))
+
+    def add_listener(self, listener):
+        """Call `listener(name, history)` with the AgentHistoryList of every finished replay"""
+        self._listeners.append(listener)
+
+    async def run(self, name, task, controller):
+        """Return the AgentHistoryList of one replayed run of the `name` flow
+
+        Raises:
+            FileNotFoundError: There are no recordings of the flow
+            BrowserPoolTimeout: No browser context became free in time
+        """
+        paths = self.recordings(name)
+        if not paths:
+            raise FileNotFoundError(f"No recorded agent runs for {name} in {self.directory}")
+        with open(self._rng.choice(paths), encoding='utf-8') as f:
+            recording = json.load(f)
+
+        outputs = [item['model_output'] for item in recording['history'] if item['model_output']]
+        decide_delays, act_delays = [], []
+        if self.time_scale:
+            # Draw every delay up front so concurrent replays cannot change each other's timings
+            for step in recording['steps']:
+                decide_delays.append(self._scale(step['decide_seconds']))
+                act_delays.append(self._scale(step['act_seconds']))
+        act_delays.reverse()
+
+        llm = ReplayChatModel(outputs=outputs, delays=decide_delays)
+        page = replay_page(outputs)
+
+        async def act_latency(state, model_output, step_number):
+            if act_delays:
+                await asyncio.sleep(act_delays.pop())
+
+        async def serve_page(route):
+            if route.request.resource_type == 'document':
+                await route.fulfill(status=200, content_type='text/html', body=page)
+            else:
+                await route.fulfill(status=204, body='')
+
+        async def run(browser_context):
+            session = await browser_context.get_session()
+            await session.context.route('**/*', serve_page)
+            try:
+                agent = Agent(
+                    task=task,
+                    browser_context=browser_context,
+                    llm=llm,
+                    controller=controller,
+                    register_new_step_callback=act_latency if act_delays else None,
+                )
+                # One step more than recorded, so a recording that never finished stops once it runs out
+                return await agent.run(max_steps=len(outputs) + 1)
+            finally:
+                await session.context.unroute('**/*', serve_page)
+
+        history = await self.pool.run(run)
+        for listener in self._listeners:
+            try:
+                listener(name, history)
+            except Exception as e:
+                print(f"Error in agent replay listener: {e}")
+        return history
+
+    def _scale(self, seconds):
+        factor = self._rng.lognormvariate(0, self.jitter) if self.jitter else 1.0
+        return max(seconds, 0) * self.time_scale * factor
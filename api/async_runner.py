@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+
+class AsyncRunner:
+    """One long-lived event loop thread that synchronous code hands coroutines to
+
+    Browser contexts and other async resources belong to the loop that
+    created them. Running every coroutine here keeps them usable across
+    calls, where asyncio.run would create and tear down a loop each time.
+    The loop starts on first use. `submit` returns a concurrent future.
+    `run` blocks for the result, and with a timeout it cancels the
+    coroutine if it overruns. `shutdown` cancels whatever is still running
+    and stops the loop.
+    """
+
+    def __init__(self, name='async-runner'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """The runner's event loop, started if it is not running yet"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name=self.name)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro, timeout=None):
+        """Schedule `coro` on the loop and return a concurrent.futures.Future for its result
+
+        With a `timeout`, the coroutine is cancelled after that many seconds
+        and the future raises asyncio.TimeoutError.
+        """
+        if timeout is not None:
+            coro = asyncio.wait_for(coro, timeout)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run `coro` on the loop and block until it finishes
+
+        Must not be called from the runner's own thread, which would deadlock.
+
+        Raises:
+            asyncio.TimeoutError: The coroutine did not finish within `timeout` seconds
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("AsyncRunner.run called from its own loop thread; await the coroutine instead")
+        return self.submit(coro, timeout).result()
+
+    def shutdown(self, timeout=30):
+        """Cancel pending tasks, wait up to `timeout` seconds for them, then stop the loop"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+
+        async def cancel_pending():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_pending(), loop).result(timeout)
+        except Exception as e:
+            print(f"Error shutting down async runner: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+
+
+# Shared by the browser pool, the order queue, menu refreshes and the Flask routes
+async_runner = AsyncRunner()
@@ -5,14 +5,31 @@ from distutils.util import strtobool
 
 from browser_use.agent.service import Agent, Controller
 from browser_use.browser.browser import Browser, BrowserConfig
+from browser_use.browser.context import BrowserContext, BrowserContextConfig
 from langchain_anthropic import ChatAnthropic
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
 from typing_extensions import Callable, Awaitable
 
+from api.agent_replay import AgentRecorder, AgentReplayer
+from api.async_runner import async_runner
+from api.menu_cache import MenuCache
+
 
 MOCK_BROWSER_AGENT = strtobool(os.environ.get("MOCK_BROWSER_AGENT", "True"))
 
+# live runs the agent, record also saves each run, replay reruns saved model outputs on a local page
+BROWSER_AGENT_MODE = os.environ.get("BROWSER_AGENT_MODE", "live")
+if BROWSER_AGENT_MODE not in ("live", "record", "replay"):
+    raise ValueError(f"Unknown browser agent mode: {BROWSER_AGENT_MODE}")
+AGENT_RECORDINGS_DIR = os.environ.get("AGENT_RECORDINGS_DIR", "recordings")
+
+# The search uses the DoorDash session's own delivery address, so all callers share one menu cache entry
+LUNCH_OPTIONS_KEY = "doordash-session"
+
+# Seconds synchronous callers wait for lunch options before giving up
+MENU_SEARCH_TIMEOUT = float(os.environ.get("MENU_SEARCH_TIMEOUT", "300"))
+
 MOCK_ITEMS = {
   "menu_items": [
     {
@@ -56,12 +73,170 @@ class MenuItems(BaseModel):
     menu_items: list[MenuItem]
 
 
-browser = Browser(
-    config=BrowserConfig(
+class BrowserPoolTimeout(Exception):
+    """No pooled browser context became free within the acquire timeout"""
+
+
+class _PooledContext:
+    __slots__ = ('context', 'tasks')
+
+    def __init__(self, context):
+        self.context = context
+        self.tasks = 0
+
+
+class BrowserPool:
+    """Keeps browser contexts warm for agent runs instead of starting a browser per run
+
+    Up to `size` contexts share one Browser. A run waits up to
+    `acquire_timeout` seconds for a free context. Idle contexts are health
+    checked before reuse, a context is closed and replaced after
+    `max_tasks_per_context` runs or any failed run, and a disconnected
+    browser is restarted.
+
+    Playwright objects belong to the event loop that created them, so the pool
+    runs everything on the shared async runner loop and `run` can be awaited
+    from any loop.
+    """
+
+    def __init__(self, browser_config, context_config=None, size=2, max_tasks_per_context=20,
+                 acquire_timeout=120, health_check_timeout=5):
+        self.browser = Browser(config=browser_config)
+        self.context_config = context_config or BrowserContextConfig()
+        # Over CDP every context drives the attached Chrome's first tab, so runs cannot overlap
+        self.size = 1 if browser_config.cdp_url else size
+        self.max_tasks_per_context = max_tasks_per_context
+        self.acquire_timeout = acquire_timeout
+        self.health_check_timeout = health_check_timeout
+        self._idle = []
+        self._slots = None
+
+    async def run(self, fn):
+        """Return `await fn(browser_context)` run on a pooled context
+
+        Raises:
+            BrowserPoolTimeout: No context became free in time
+        """
+        if asyncio.get_running_loop() is async_runner.loop:
+            return await self._run(fn)
+        return await asyncio.wrap_future(async_runner.submit(self._run(fn)))
+
+    def warm_up(self):
+        """Start the browser and fill the pool in the background"""
+        async_runner.submit(self._warm_up())
+
+    def close(self, timeout=30):
+        async_runner.run(self._close(), timeout)
+
+    async def _acquire_slot(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise BrowserPoolTimeout(f"No browser context became free within {self.acquire_timeout}s")
+
+    async def _run(self, fn):
+        await self._acquire_slot()
+        pooled = None
+        succeeded = False
+        try:
+            pooled = await self._checkout()
+            result = await fn(pooled.context)
+            succeeded = True
+            return result
+        finally:
+            if pooled is not None:
+                await self._checkin(pooled, succeeded)
+            self._slots.release()
+
+    async def _warm_up(self):
+        acquired = 0
+        warmed = []
+        try:
+            for _ in range(self.size):
+                await self._acquire_slot()
+                acquired += 1
+                warmed.append(await self._checkout())
+        except Exception as e:
+            print(f"Error warming up browser pool: {e}")
+        finally:
+            for pooled in warmed:
+                await self._checkin(pooled, True, count=False)
+            for _ in range(acquired):
+                self._slots.release()
+
+    def _browser_connected(self):
+        playwright_browser = self.browser.playwright_browser
+        return playwright_browser is not None and playwright_browser.is_connected()
+
+    async def _is_healthy(self, pooled):
+        if not self._browser_connected():
+            return False
+        try:
+            page = await pooled.context.get_current_page()
+            await asyncio.wait_for(page.evaluate('1'), self.health_check_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def _checkout(self):
+        while self._idle:
+            pooled = self._idle.pop()
+            if await self._is_healthy(pooled):
+                return pooled
+            await self._discard(pooled)
+
+        if self.browser.playwright_browser is not None and not self._browser_connected():
+            print("Browser disconnected, restarting it")
+            await self.browser.close()
+
+        context = BrowserContext(browser=self.browser, config=self.context_config)
+        await context.get_session()
+        return _PooledContext(context)
+
+    async def _checkin(self, pooled, succeeded, count=True):
+        if count:
+            pooled.tasks += 1
+        if succeeded and pooled.tasks < self.max_tasks_per_context:
+            self._idle.append(pooled)
+        else:
+            await self._discard(pooled)
+
+    async def _discard(self, pooled):
+        try:
+            await pooled.context.close()
+        except Exception as e:
+            print(f"Error closing browser context: {e}")
+
+    async def _close(self):
+        while self._idle:
+            await self._discard(self._idle.pop())
+        await self.browser.close()
+
+
+# Attach to a running Chrome over CDP by default; set BROWSER_CDP_URL empty to launch
+# headless Chromium, whose contexts are isolated and can run in parallel
+BROWSER_CDP_URL = os.environ.get("BROWSER_CDP_URL", "http://localhost:9222")
+
+browser_pool = BrowserPool(
+    BrowserConfig(
         headless=True,
-        cdp_url="http://localhost:9222"
+        cdp_url=BROWSER_CDP_URL or None
         # chrome_instance_path='/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',  # macOS path
-    )
+    ),
+    # Launched contexts share a logged-in session through a cookies file
+    context_config=BrowserContextConfig(cookies_file=os.environ.get("BROWSER_COOKIES_FILE") or None),
+    size=int(os.environ.get("BROWSER_POOL_SIZE", "2")),
+    max_tasks_per_context=int(os.environ.get("BROWSER_CONTEXT_MAX_TASKS", "20")),
+    acquire_timeout=float(os.environ.get("BROWSER_ACQUIRE_TIMEOUT", "120")),
+)
+
+agent_recorder = AgentRecorder(AGENT_RECORDINGS_DIR)
+agent_replayer = AgentReplayer(
+    AGENT_RECORDINGS_DIR,
+    browser_pool,
+    time_scale=float(os.environ.get("AGENT_REPLAY_TIME_SCALE", "0")),
 )
 
 # llm = ChatAnthropic(model_name="claude-3-7-sonnet-20250219")
@@ -89,15 +264,40 @@ async def find_something(query: str):
         """
 
     controller = Controller(output_model=MenuItems)
-    result = await run_browser_agent(task, controller)
+    result = await run_browser_agent(task, controller, "find_something")
     return result
 
 
 async def find_2_lunch_options():
+    """Return menu items for lunch, served from the menu cache when possible."""
+
+    if MOCK_BROWSER_AGENT:
+        return MOCK_ITEMS
+
+    return await lunch_options_cache.get(LUNCH_OPTIONS_KEY)
+
+
+def prefetch_lunch_options():
+    """Warm the menu cache in the background so a later reminder can attach options instantly."""
+
+    if not MOCK_BROWSER_AGENT:
+        lunch_options_cache.prefetch(LUNCH_OPTIONS_KEY)
+
+
+def cached_lunch_options():
+    """Return lunch options already in the menu cache, or None, without running the browser agent."""
 
     if MOCK_BROWSER_AGENT:
         return MOCK_ITEMS
 
+    return lunch_options_cache.peek(LUNCH_OPTIONS_KEY)
+
+
+async def search_lunch_options(key: str = LUNCH_OPTIONS_KEY):
+    """Run the browser agent to find lunch options; the DoorDash session decides the delivery address.
+
+    `key` is the menu cache key and does not change the search.
+    """
     task = f"""
     1. Start by going to: https://www.doordash.com/home
     2. Open the first option under 'Fastest near you' category on the same tab/page
@@ -105,21 +305,49 @@ async def find_2_lunch_options():
     4. From the newly opened page of restaurant - Extract the item name, item price, and item image URL for the top 3 items listed under the ‘Most Ordered’ section. The item URL is critical.   
     """
     controller = Controller(output_model=MenuItems)
-    result = await run_browser_agent(task, controller)
+    result = await run_browser_agent(task, controller, "lunch_options")
+    if result is None:
+        raise RuntimeError("Browser agent returned no menu items")
     return result.model_dump()
 
 
-async def run_browser_agent(task: str, controller: Controller):
-    """Run the browser-use agent with the specified task."""
-    agent = Agent(
-        task=task_template.format(task=task),
-        browser=browser,
-        llm=llm,
-        controller=controller
-    )
+# Menu searches take tens of seconds, so results are cached and refreshed in the background
+lunch_options_cache = MenuCache(
+    search_lunch_options,
+    ttl=int(os.environ.get("MENU_CACHE_TTL", "900")),
+    max_stale=int(os.environ.get("MENU_CACHE_MAX_STALE", "21600")),
+)
+
+
+async def run_agent(task: str, controller: Controller, name: str):
+    """Run the browser-use agent with the specified task on a pooled browser context and return its history.
 
-    result = await agent.run()
-    await browser.close()
+    `name` identifies the flow in BROWSER_AGENT_MODE record and replay.
+    """
+    if BROWSER_AGENT_MODE == "replay":
+        return await agent_replayer.run(name, task_template.format(task=task), controller)
+
+    timer = agent_recorder.timer() if BROWSER_AGENT_MODE == "record" else None
+
+    async def run(browser_context):
+        agent = Agent(
+            task=task_template.format(task=task),
+            browser_context=browser_context,
+            llm=llm,
+            controller=controller,
+            register_new_step_callback=timer.on_step if timer else None
+        )
+        return await agent.run()
+
+    history = await browser_pool.run(run)
+    if timer:
+        agent_recorder.save(name, history, timer)
+    return history
+
+
+async def run_browser_agent(task: str, controller: Controller, name: str):
+    """Run the browser-use agent with the specified task and parse its menu items."""
+    result = await run_agent(task, controller, name)
     result = result.final_result()
     if result:
         parsed: MenuItems = MenuItems.model_validate_json(result)
@@ -127,16 +355,26 @@ async def run_browser_agent(task: str, controller: Controller):
     return None
 
 
+class OrderFailedError(Exception):
+    """The browser agent did not complete the checkout"""
+
+
 async def order_food(restaurant_url: str, item_name: str) -> str:
     """Order food from a restaurant.
 
     Args:
         restaurant_url: URL of the restaurant
         item_name: Name of the item to order
+
+    Returns:
+        Confirmation message once the order has been placed
+
+    Raises:
+        OrderFailedError: The agent gave up or reported failure
     """
 
     if MOCK_BROWSER_AGENT:
-        return f"Order for '{item_name}' started. Your order is being processed."
+        return f"Your {item_name} was ordered."
 
     task = f"""
 1. Go to {restaurant_url}
@@ -150,21 +388,11 @@ async def order_food(restaurant_url: str, item_name: str) -> str:
 9. Click "Place order"
 """
 
-    # Start the background task for ordering
-    await perform_order(task)
-
-    # Return a message immediately
-    return f"Order for '{item_name}' started. Your order is being processed."
-
-
-async def perform_order(task: str):
-    """Perform the actual food ordering in the background."""
-    try:
-        controller = Controller()
-        result = await run_browser_agent(task=task, controller=controller)
-        return result
-    except Exception as e:
-        return "Error when doing the order"
+    history = await run_agent(task, Controller(), "order_food")
+    if not history.is_done() or history.is_successful() is False:
+        errors = [error for error in history.errors() if error]
+        raise OrderFailedError(history.final_result() or (errors[-1] if errors else "the checkout did not finish"))
+    return f"Your {item_name} was ordered."
 
 # if __name__ == "__main__":
     # asyncio.run(find_2_lunch_options())
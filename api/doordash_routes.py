@@ -1,7 +1,9 @@
 from flask import Blueprint, jsonify, request
 from pydantic import BaseModel
 
-from api.browser import find_2_lunch_options, order_food
+from api.async_runner import async_runner
+from api.browser import MENU_SEARCH_TIMEOUT, find_2_lunch_options, lunch_options_cache
+from api.order_jobs import order_jobs
 from logging import getLogger
 from traceback import format_exc
 
@@ -13,9 +15,9 @@ logger = getLogger(__name__)
 doordash_bp = Blueprint('doordash_bp', __name__, url_prefix='/doordash')
 
 @doordash_bp.route('/', methods=['GET'])
-async def index():
+def index():
     try:
-        result = await find_2_lunch_options()
+        result = async_runner.run(find_2_lunch_options(), MENU_SEARCH_TIMEOUT)
     except Exception as e:
         logger.error("Cannot find 2 lunch options", exc_info=e)
         result = {"error": "Cannot find 2 lunch options"}
@@ -23,12 +25,26 @@ async def index():
     return jsonify(result)
 
 @doordash_bp.route('/order', methods=['POST'])
-async def make_order():
+def make_order():
+    """Queue an order; poll /doordash/order/<job_id> for its outcome"""
     try:
         data = request.get_json()
-        result = await order_food(data.get("restaurant_url"), data.get("item_name"))
+        job = order_jobs.submit(data.get("user_id", "default_user"), data["restaurant_url"], data["item_name"])
     except Exception as e:
         logger.error("Cannot order food", exc_info=e)
-        result = {"error": "Cannot order food"}
-
-    return jsonify(result)
+        return jsonify({"error": "Cannot order food"}), 400
+
+    return jsonify(job), 202
+
+@doordash_bp.route('/order/<job_id>', methods=['GET'])
+def order_status(job_id):
+    job = order_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown order"}), 404
+    return jsonify(job)
+
+@doordash_bp.route('/menu-cache', methods=['DELETE'])
+def invalidate_menu_cache():
+    """Forget cached lunch options so the next request runs a fresh search"""
+    lunch_options_cache.invalidate()
+    return jsonify({"invalidated": "all"})
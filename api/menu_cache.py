@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+
+from api.async_runner import async_runner
+
+
+class MenuCache:
+    """Stale-while-revalidate cache for slow menu searches
+
+    `loader(key)` is a coroutine function producing the value for a key.
+    Values younger than `ttl` seconds are served as they are. Older ones, up
+    to `max_stale` seconds, are still served immediately while one background
+    refresh replaces them. Missing or expired keys wait for a load, which
+    concurrent callers share. Failed loads are not cached and leave any stale
+    value in place. A caller that gives up waiting does not cancel the load
+    for the others. Expired entries are dropped, and beyond `max_entries` the
+    least recently loaded ones are too.
+
+    Loads run on the shared async runner loop, so `get` can be awaited from
+    any event loop and a refresh outlives the request that started it.
+    """
+
+    def __init__(self, loader, ttl=900, max_stale=21600, max_entries=64):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (value, loaded_at), oldest load first
+        self._loading = {}  # key -> concurrent.futures.Future
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+
+    async def get(self, key):
+        """Return the value for `key`, loading it only if nothing usable is cached"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            age = now - entry[1] if entry is not None else None
+            if age is not None and age < self.ttl:
+                self._hits += 1
+                return entry[0]
+            if age is not None and age < self.max_stale:
+                self._stale_hits += 1
+                self._load_locked(key)
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self._misses += 1
+            future = self._load_locked(key)
+
+        # Shielded so a caller that times out or is cancelled leaves the shared load to the others
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def refresh(self, key):
+        """Start loading `key` in the background unless a load is already running"""
+        with self._lock:
+            return self._load_locked(key)
+
+    def prefetch(self, key):
+        """Start loading `key` ahead of demand unless a fresh value is cached or a load is running"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                return None
+            return self._load_locked(key)
+
+    def peek(self, key):
+        """Return the cached value for `key` if it is still servable, without waiting or loading"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.max_stale:
+                self._hits += 1
+                return entry[0]
+            return None
+
+    def invalidate(self, key=None):
+        """Forget one key, or every key if none is given"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'stale_hits': self._stale_hits,
+                'misses': self._misses,
+                'loading': len(self._loading),
+            }
+
+    def _prune_locked(self):
+        """Drop expired entries, then the oldest ones beyond max_entries"""
+        now = time.monotonic()
+        for key, (value, loaded_at) in list(self._entries.items()):
+            if now - loaded_at < self.max_stale and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def _load_locked(self, key):
+        future = self._loading.get(key)
+        if future is None:
+            future = self._loading[key] = async_runner.submit(self._load(key))
+        return future
+
+    async def _load(self, key):
+        try:
+            value = await self.loader(key)
+            with self._lock:
+                # Re-inserting keeps the dict ordered by load time
+                self._entries.pop(key, None)
+                self._entries[key] = (value, time.monotonic())
+                self._prune_locked()
+            return value
+        except Exception as e:
+            print(f"Error loading menu for {key}: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from api.async_runner import async_runner
+from api.browser import order_food
+
+
+class OrderJobQueue:
+    """Places food orders in the background, tracked as jobs in SQLite
+
+    Submitting an order stores a queued job and returns at once. `workers`
+    coroutines on the shared async runner loop place orders
+    concurrently. Each status change (queued, running, succeeded, failed)
+    is written to the database and passed to every listener, off the
+    loop in a worker thread so SQLite and listeners never block it. A job
+    that hits an unexpected error is marked failed and the worker carries
+    on with the next one. After a restart, queued jobs are picked up
+    again. Jobs that were running are marked failed rather than retried,
+    since the checkout may have gone through.
+    """
+
+    def __init__(self, db_path, place_order, workers=2):
+        self.place_order = place_order
+        self.workers = workers
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS order_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    room TEXT,
+                    restaurant_url TEXT NOT NULL,
+                    item_name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    message TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS order_jobs_status ON order_jobs (status)")
+
+        self._loop = None
+        self._queue = None
+        self._start_lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """Call `listener(job)` with the job dict after every status change"""
+        self._listeners.append(listener)
+
+    def start(self):
+        """Start the worker loop and re-queue jobs left over from a previous run"""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = async_runner.loop
+            async_runner.run(self._start_workers())
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE order_jobs SET status = 'failed', message = ?, updated_at = ? WHERE status = 'running'",
+                ("Interrupted by a restart; check your DoorDash orders before retrying", time.time())
+            )
+            queued = [row['job_id'] for row in self._conn.execute(
+                "SELECT job_id FROM order_jobs WHERE status = 'queued' ORDER BY created_at"
+            )]
+        for job_id in queued:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, job_id)
+
+    def submit(self, user_id, restaurant_url, item_name, room=None):
+        """Queue an order and return its job dict"""
+        self.start()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO order_jobs
+                   (job_id, user_id, room, restaurant_url, item_name, status, message, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)""",
+                (job_id, user_id, room, restaurant_url, item_name, f"Ordering {item_name}...", now, now)
+            )
+        job = self.get(job_id)
+        self._notify(job)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, job_id)
+        return job
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it does not exist"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM order_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM order_jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+
+    def _update(self, job_id, status, message):
+        """Store a status change and notify listeners; blocks, so call it off the loop"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE order_jobs SET status = ?, message = ?, updated_at = ? WHERE job_id = ?",
+                (status, message, time.time(), job_id)
+            )
+        job = self.get(job_id)
+        self._notify(job)
+        return job
+
+    def _notify(self, job):
+        for listener in self._listeners:
+            try:
+                listener(job)
+            except Exception as e:
+                print(f"Error in order job listener: {e}")
+
+    async def _start_workers(self):
+        self._queue = asyncio.Queue()
+        for _ in range(self.workers):
+            self._loop.create_task(self._work())
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                # Keep the worker alive; the order may or may not have gone through
+                print(f"Order job {job_id} failed: {e}")
+                try:
+                    await asyncio.to_thread(self._update, job_id, 'failed',
+                                            f"Something went wrong with this order, check your DoorDash orders before retrying: {e}")
+                except Exception as e:
+                    print(f"Error marking order job {job_id} failed: {e}")
+
+    async def _run(self, job_id):
+        # SQLite writes and listeners block, so they run off the shared loop
+        job = await asyncio.to_thread(self._update, job_id, 'running', "Placing your order...")
+        if job is None:
+            print(f"Order job {job_id} no longer exists, skipping it")
+            return
+        try:
+            message = await self.place_order(job['restaurant_url'], job['item_name'])
+        except Exception as e:
+            print(f"Order job {job_id} failed: {e}")
+            await asyncio.to_thread(self._update, job_id, 'failed', f"Sorry, I couldn't order {job['item_name']}: {e}")
+        else:
+            await asyncio.to_thread(self._update, job_id, 'succeeded', message)
+
+order_jobs = OrderJobQueue(
+    os.environ.get("ORDER_JOBS_DB", "order_jobs.db"),
+    order_food,
+    workers=int(os.environ.get("ORDER_WORKERS", "2")),
+)
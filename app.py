@@ -1,17 +1,26 @@
-import asyncio
-
-from api.browser import find_2_lunch_options, order_food
+from api.async_runner import async_runner
+from api.browser import (MOCK_BROWSER_AGENT, MENU_SEARCH_TIMEOUT, browser_pool, cached_lunch_options, find_2_lunch_options,
+                         lunch_options_cache, prefetch_lunch_options)
+from api.order_jobs import order_jobs
 from flask import Flask, render_template, request, jsonify, session
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import os
 import json
 import datetime
-from dateutil import parser
-from google_calendar import GoogleCalendarAPI
+from google_calendar import BATCH_LIMIT, MEAL_WINDOWS, GoogleCalendarAPI
+from highrise_client import HighriseClient, HighriseError, ThinkTagFilter
+from conversation_store import ConversationStore
+from message_dedup import dedup_from_env
+from priority_executor import PriorityExecutor
+from response_cache import ResponseCache, cache_key
+from reminder_scheduler import ReminderScheduler
 from dotenv import load_dotenv
+import atexit
+import concurrent.futures
+import functools
 import threading
 import time
-import requests
+import uuid
 
 # Load environment variables
 load_dotenv(override=True) # Force load/override from .env
@@ -26,7 +35,67 @@ highrise_api_key = os.getenv('HIGHRISE_API_KEY')
 highrise_base_url = os.getenv('HIGHRISE_BASE_URL', 'https://cloud.highrise.ai/highrise-api/maas/ai')
 highrise_model = os.getenv('HIGHRISE_MODEL', 'DeepSeek-R1')
 
-# No OpenAI client needed - using direct requests to Highrise API
+# Chat turns run on a bounded worker pool so Socket.IO handlers never wait on the LLM
+CHAT_PRIORITY_REMINDER = 0
+CHAT_PRIORITY_CHAT = 1
+chat_workers = int(os.getenv('CHAT_WORKERS', '8'))
+chat_executor = PriorityExecutor(
+    max_workers=chat_workers,
+    max_queue=int(os.getenv('CHAT_QUEUE_SIZE', '64')),
+    thread_name_prefix='chat'
+)
+
+# One keep-alive client shared by every chat turn, with a pooled connection per worker
+highrise_client = HighriseClient(
+    highrise_base_url,
+    highrise_api_key,
+    pool_size=int(os.getenv('HIGHRISE_POOL_SIZE', str(chat_workers))),
+    connect_timeout=float(os.getenv('HIGHRISE_CONNECT_TIMEOUT', '5')),
+    read_timeout=float(os.getenv('HIGHRISE_READ_TIMEOUT', '60')),
+    max_retries=int(os.getenv('HIGHRISE_MAX_RETRIES', '3')),
+)
+
+def summarize_conversation(summary, messages):
+    """Fold older messages into the rolling conversation summary using the LLM"""
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    prompt = f"Summary so far: {summary or 'none'}\n\nNew messages:\n{transcript}"
+    payload = {
+        'model': "Meta-Llama-31-70B-Instruct",
+        'messages': [
+            {'role': 'system', 'content': "Update the summary of this conversation between a user and their executive assistant. Keep preferences, plans and open requests. Reply with the summary only, in under 150 words."},
+            {'role': 'user', 'content': prompt},
+        ],
+        'max_tokens': 256,
+        'temperature': 0.2,
+    }
+    think_filter = ThinkTagFilter()
+    text = ''.join(think_filter.feed(delta) for delta in highrise_client.stream_chat(payload))
+    return text + think_filter.flush()
+
+def forget_user(user_id):
+    """Drop per-user state once a user has been idle long enough to be evicted"""
+    planned_calendars.pop(user_id, None)
+    reminder_scheduler.cancel_user(user_id)
+    calendar_api.event_cache.drop(user_id)
+    calendar_api.service_pool.discard(user_id)
+
+# Replies to near-identical trailing context are served from memory
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_ENTRIES', '1000')),
+    max_bytes=int(os.getenv('RESPONSE_CACHE_BYTES', str(5 * 1024 * 1024))),
+    ttl=int(os.getenv('RESPONSE_CACHE_TTL', '600')),
+)
+response_cache_context = int(os.getenv('RESPONSE_CACHE_CONTEXT_MESSAGES', '3'))
+
+# Bounded chat memory; only users active within the idle TTL are swept for calendar changes
+conversations = ConversationStore(
+    max_messages=int(os.getenv('CONVERSATION_MAX_MESSAGES', '50')),
+    context_tokens=int(os.getenv('CONVERSATION_CONTEXT_TOKENS', '3000')),
+    idle_ttl=int(os.getenv('CONVERSATION_IDLE_TTL', '86400')),
+    max_users=int(os.getenv('CONVERSATION_MAX_USERS', '10000')),
+    summarizer=summarize_conversation if os.getenv('CONVERSATION_SUMMARIES', 'false').lower() == 'true' else None,
+    on_evict=forget_user,
+)
 
 # Import Blueprints
 from api.doordash_routes import doordash_bp
@@ -38,11 +107,33 @@ app.register_blueprint(doordash_bp)
 calendar_api = GoogleCalendarAPI()
 
 # Global variables
-user_state = {}
 active_reminders = {}
-
-# Track message ids to prevent duplicates
-message_ids = set()
+planned_calendars = {}
+
+# Meal reminders fire from a priority queue; the calendar loop only keeps it current
+reminder_scheduler = ReminderScheduler()
+calendar_poll_interval = int(os.getenv('CALENDAR_POLL_INTERVAL', '300'))
+
+# Meal reminders are timed against free slots from the user's busy-interval index
+calendar_busy_source = os.getenv('CALENDAR_BUSY_SOURCE', 'cache')  # cache or freebusy
+min_meal_gap = datetime.timedelta(minutes=int(os.getenv('MIN_MEAL_GAP_MINUTES', '30')))
+meal_order_lead = datetime.timedelta(hours=1)
+# Menus are fetched this long before each meal reminder so it can go out with food options attached
+menu_prefetch_lead = datetime.timedelta(minutes=int(os.getenv('MENU_PREFETCH_LEAD_MINUTES', '20')))
+
+# Batched calendar syncs and per-user reminder planning run concurrently on a bounded pool
+calendar_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv('CALENDAR_CHECK_CONCURRENCY', '16')),
+    thread_name_prefix='calendar-check'
+)
+calendar_check_timeout = int(os.getenv('CALENDAR_CHECK_TIMEOUT', '60'))
+# user_id -> (future, deadline) of the batched sync covering the user, and of the user's own planning
+calendar_syncs = {}
+calendar_checks = {}
+calendar_checks_lock = threading.Lock()
+
+# Track recent message ids per user to prevent duplicates
+message_dedup = dedup_from_env()
 
 @app.route('/')
 def index():
@@ -53,15 +144,24 @@ def index():
 @socketio.on('order')
 def handle_order(data):
     user_id = data.get('user_id', 'default_user')
-    message_id = data.get('message_id', '')
 
-    # print(f"Order received: {data['name']} from {data['restaurant']}")
-    # print(f"Order URL: {data['url']}")
-    asyncio.run(order_food(data['restaurant_url'], data['item_name']))
+    # The checkout runs on the order job workers; progress arrives as order_status events
+    order_jobs.submit(user_id, data['restaurant_url'], data['item_name'], room=request.sid)
 
-    emit('response',
-         {'response': "Your food was ordered", 'user_id': user_id, 'message_id': message_id},
-         room=request.sid)
+
+def emit_order_status(job):
+    """Relay an order job's status change to the room that placed it"""
+    if not job['room']:
+        return
+    socketio.emit('order_status', {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'message': job['message'],
+        'item_name': job['item_name'],
+        'user_id': job['user_id'],
+    }, room=job['room'])
+
+order_jobs.add_listener(emit_order_status)
 
 
 @socketio.on('connect')
@@ -71,13 +171,17 @@ def handle_connect():
     join_room(request.sid)
     print(f"Client {request.sid} joined their own room")
     
+    # An open page counts as activity, so the calendar sweep keeps reminding this user
+    user_id = request.args.get('user_id', 'default_user')
+    conversations.touch(user_id)
+    
     # Send initial welcome message with food options
     initial_message = """Hello! I'll ping you when it's lunch time"""
     
     emit('response', 
          {
              'response': initial_message,
-             'user_id': 'default_user',
+             'user_id': user_id,
              'message_id': 'initial',
          },
          room=request.sid)
@@ -98,18 +202,11 @@ def handle_message(data):
     message_id = data.get('message_id', '')
     
     # Check if we've already processed this message to prevent duplicates
-    if message_id and message_id in message_ids:
+    if message_id and message_dedup.seen(user_id, message_id):
         print(f"Ignoring duplicate message with ID: {message_id}")
         return
     
     print(f"Processing message from {user_id} in room {request.sid}: {user_message[:50]}...")
-        
-    # Add message_id to our tracking set
-    if message_id:
-        message_ids.add(message_id)
-        # Limit size of the set to avoid memory issues
-        if len(message_ids) > 1000:
-            message_ids.clear()
     
     if user_message == "show food options":
         food_options = {
@@ -130,15 +227,49 @@ def handle_message(data):
              {'response': 'Here you go', 'user_id': user_id, 'message_id': message_id, 'food_options': food_options},
              room=request.sid)
     else:
-        # Get response from LLM
-        response = generate_response(user_message, user_id)
+        # Chunks are tied together by message ID, so reminder replies without one get their own
+        message_id = message_id or f"stream_{uuid.uuid4().hex}"
         
-        # Send response back only to the requesting client using their room
-        emit('response', 
-            {'response': response, 'user_id': user_id, 'message_id': message_id},
-            room=request.sid)
-
-def generate_response(message, user_id):
+        # Reminder-driven prompts outrank ad-hoc chat; the handler returns once the turn is queued
+        priority = CHAT_PRIORITY_REMINDER if data.get('source') == 'reminder' else CHAT_PRIORITY_CHAT
+        # Clients can ask for a fresh answer by sending no_cache
+        use_cache = not data.get('no_cache')
+        if not chat_executor.submit(priority, answer_message, request.sid, user_message, user_id, message_id,
+                                    use_cache=use_cache):
+            print(f"Chat queue full, turning away message from {user_id}")
+            emit('response', 
+                 {'response': "I'm handling a lot of requests right now. Please try again in a moment.",
+                  'user_id': user_id, 'message_id': message_id, 'error': True},
+                 room=request.sid)
+
+def answer_message(sid, user_message, user_id, message_id, use_cache=True):
+    """Generate a reply on a chat worker and stream it to the client's room"""
+    def send_chunk(chunk):
+        socketio.emit('response_chunk',
+                      {'chunk': chunk, 'user_id': user_id, 'message_id': message_id},
+                      room=sid)
+    
+    # Stream the LLM response as it is generated
+    response, failed = generate_response(user_message, user_id, on_chunk=send_chunk, use_cache=use_cache)
+    
+    # Send the complete response back only to the requesting client using their room
+    payload = {'response': response, 'user_id': user_id, 'message_id': message_id}
+    if failed:
+        # Error replies are still shown, but clients can tell them from answers
+        payload['error'] = True
+    socketio.emit('response', payload, room=sid)
+
+def generate_response(message, user_id, on_chunk=None, use_cache=True):
+    """Get the assistant's reply to a user message
+    
+    The reply is streamed from the Highrise API with <think> sections removed,
+    unless a cached reply to the same trailing context exists and `use_cache`
+    is set. `on_chunk(text)` is called with each new piece of visible text.
+    
+    Returns:
+        (reply, failed): The complete reply, and whether it is an error
+        message shown in place of an answer
+    """
     try:
         # Create a system prompt that defines the assistant's role
         system_prompt = """You are ExecuMate, an AI Executive Assistant that helps users manage their tasks, including ordering food.
@@ -151,79 +282,58 @@ def generate_response(message, user_id):
         Respond in a friendly, professional manner appropriate for an executive assistant.
         """
         
-        # Get conversation history or initialize if it doesn't exist
-        if user_id not in user_state:
-            user_state[user_id] = {
-                "conversation_history": []
-            }
-        
         # Add user message to history
-        user_state[user_id]["conversation_history"].append({"role": "user", "content": message})
+        conversations.append(user_id, "user", message)
+        
+        # Prepare messages from the newest turns that fit the context budget
+        messages = conversations.context(user_id, system_prompt)
         
-        # Prepare messages for OpenAI
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(user_state[user_id]["conversation_history"][-10:])  # Keep last 10 messages
+        payload = {
+            'model': "Meta-Llama-31-70B-Instruct",
+            'messages': messages,
+            'max_tokens': 1028,
+            'temperature': 0.5,
+            'top_p': 0.5,
+        }
+        
+        # Near-identical turns are answered from the response cache
+        key = None
+        if use_cache:
+            params = {name: value for name, value in payload.items() if name not in ('model', 'messages')}
+            key = cache_key(payload['model'], params, messages, trailing=response_cache_context)
+            cached = response_cache.get(key)
+            if cached is not None:
+                if on_chunk:
+                    on_chunk(cached)
+                conversations.append(user_id, "assistant", cached)
+                return cached, False
         
-        # Get response from Highrise AI using direct requests
+        # Stream the response from Highrise AI, relaying visible text as it arrives
+        think_filter = ThinkTagFilter()
+        chunks = []
+        failed = True
         try:
-            # Create headers and payload
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {highrise_api_key}'
-            }
-            
-            payload = {
-                'model': "Meta-Llama-31-70B-Instruct",
-                'messages': messages,
-                'max_tokens': 1028,
-                'temperature': 0.5,
-                'top_p': 0.5,
-                'stream': False  # Explicitly disable streaming to get a complete response
-            }
+            for delta in highrise_client.stream_chat(payload):
+                chunk = think_filter.feed(delta)
+                if chunk:
+                    chunks.append(chunk)
+                    if on_chunk:
+                        on_chunk(chunk)
             
-            # Send request to Highrise API
-            chat_endpoint = f"{highrise_base_url}/chat/completions"
+            chunk = think_filter.flush()
+            if chunk:
+                chunks.append(chunk)
+                if on_chunk:
+                    on_chunk(chunk)
             
-            response = requests.post(chat_endpoint, json=payload, headers=headers)
-            
-            # Parse the response
-            # print(f"Response headers: {response.headers}")
-            
-            # Safely check response content
-            response_text = response.text
-            # print(f"response text: {response_text}")
-            
-            if response.status_code == 200:
-                # Parse the Highrise API response format
-                try:
-                    response_data = response.json()
-                    # print(f"Response data structure: {json.dumps(response_data, indent=2)[:200]}...")
-                    
-                    # Extract message from the correct response structure
-                    if 'data' in response_data:
-                        data = response_data['data']
-                        if 'choices' in data and len(data['choices']) > 0:
-                            choice = data['choices'][0]
-                            if 'message' in choice and 'content' in choice['message']:
-                                assistant_message = choice['message']['content']
-                            else:
-                                assistant_message = "Response missing message content"
-                        else:
-                            assistant_message = "Response missing choices"
-                    else:
-                        # Fallback for other response formats
-                        if 'choices' in response_data and len(response_data['choices']) > 0:
-                            choice = response_data['choices'][0]
-                            if 'message' in choice and 'content' in choice['message']:
-                                assistant_message = choice['message']['content']
-                            else:
-                                assistant_message = "Response missing message content"
-                        else:
-                            assistant_message = "Response missing expected data structure"
-                except json.JSONDecodeError as json_err:
-                    assistant_message = f"Error parsing JSON response: {str(json_err)}"
-            else:
-                assistant_message = f"Server error: {response.status_code} - {response_text[:100]}"
+            assistant_message = ''.join(chunks) or "Response missing message content"
+            failed = not chunks
+            if key is not None and chunks:
+                response_cache.put(key, assistant_message)
+        except HighriseError as e:
+            assistant_message = str(e)
+        except json.JSONDecodeError as json_err:
+            assistant_message = f"Error parsing JSON response: {str(json_err)}"
         except Exception as e:
             import traceback
             error_trace = traceback.format_exc()
@@ -231,18 +341,197 @@ def generate_response(message, user_id):
             assistant_message = f"Sorry, I encountered an error: {str(e)}"
         
         # Add assistant message to history
-        user_state[user_id]["conversation_history"].append({"role": "assistant", "content": assistant_message})
-
-        # assistant_message = assistant_message.split("</think>")[-1]
+        conversations.append(user_id, "assistant", assistant_message)
         
-        return assistant_message
+        return assistant_message, failed
     
     except Exception as e:
         print(f"Error generating response: {e}")
-        return "I'm having trouble processing your request right now. Please try again later."
+        return "I'm having trouble processing your request right now. Please try again later.", True
+
+def send_reminder(reminder_key, user_id, message, event):
+    """Emit a reminder, with any prefetched food options, and mark it as sent"""
+    payload = {
+        'message': message,
+        'user_id': user_id,
+        'event': event
+    }
+    # Only what the prefetch already cached; the reminder never waits on a menu search
+    food_options = cached_lunch_options()
+    if food_options and food_options.get('menu_items'):
+        payload['food_options'] = food_options['menu_items']
+    socketio.emit('reminder', payload)
+    active_reminders[reminder_key] = datetime.datetime.now()
+    # Keep users who are only getting reminders in the sweep
+    conversations.touch(user_id)
+    print(f"Sent reminder {reminder_key}: {message}")
+
+def plan_reminders(user_id):
+    """Rebuild a user's pending meal reminders from their cached calendar
+    
+    Does nothing unless the user's calendar or the current day changed since
+    the last plan that completed. A plan that fails or finds no busy data is
+    not recorded, so the next calendar check tries again.
+    """
+    now = datetime.datetime.now()
+    # Sync first; the change listener skips users whose plan is running, so a change found now is planned here
+    calendar = calendar_api.sync_events(user_id)
+    plan_key = (calendar.version, now.date())
+    if planned_calendars.get(user_id) == plan_key:
+        return
+    
+    day_start = datetime.datetime.combine(now.date(), datetime.time.min)
+    if calendar_busy_source == 'freebusy':
+        busy = calendar_api.query_free_busy(user_id, day_start, day_start + datetime.timedelta(days=1))
+    else:
+        busy = calendar_api.get_busy_index(user_id)
+    if busy is None:
+        return
+    print(f"Planning reminders for {user_id} from {len(busy)} busy blocks")
+    
+    reminders = {}
+    today = now.strftime('%Y-%m-%d')
+    general_reminders = {
+        # meal: (window start, window end, minutes until the suggested meal, message, summary)
+        'lunch': (datetime.time(11, 30), datetime.time(11, 45), 30,
+                  "It's almost lunchtime. Would you like me to suggest some food options for delivery?", 'Lunch Break'),
+        'dinner': (datetime.time(17, 45), datetime.time(18, 0), 15,
+                   "It's approaching dinner time. Would you like me to suggest some food options for delivery?", 'Dinner Time'),
+    }
+    
+    for meal_type, (meal_start, meal_end) in MEAL_WINDOWS.items():
+        window_start = datetime.datetime.combine(now.date(), meal_start)
+        window_end = datetime.datetime.combine(now.date(), meal_end)
+        if now >= window_end:
+            continue
+        
+        if not busy.busy_between(window_start, window_end):
+            # General mealtime reminder for a meal window without meetings
+            general_start, general_end, lead_minutes, reminder_message, summary = general_reminders[meal_type]
+            general_key = f"{user_id}_general_{meal_type}_{today}"
+            if general_key in active_reminders or now.time() > general_end:
+                continue
+            
+            reminder_time = max(datetime.datetime.combine(now.date(), general_start), now)
+            event = {'summary': summary, 'start': {'dateTime': (reminder_time + datetime.timedelta(minutes=lead_minutes)).isoformat()}}
+            reminders[general_key] = (
+                reminder_time,
+                functools.partial(send_reminder, general_key, user_id, reminder_message, event)
+            )
+            continue
+        
+        # Meetings overlap the meal window, so suggest the longest free slot left in it
+        gap = busy.largest_free_gap(max(window_start, now), window_end)
+        if gap and gap[1] - gap[0] >= min_meal_gap:
+            slot_key = f"{user_id}_{meal_type}_slot_{today}"
+            if slot_key in active_reminders:
+                continue
+            
+            slot_start_str = gap[0].strftime("%I:%M %p")
+            slot_end_str = gap[1].strftime("%I:%M %p")
+            reminder_message = f"Your {meal_type} hours are busy, but you're free from {slot_start_str} to {slot_end_str}. Would you like to order {meal_type} for then?"
+            event = {
+                'summary': f"{meal_type.capitalize()} Break",
+                'start': {'dateTime': gap[0].isoformat()},
+                'end': {'dateTime': gap[1].isoformat()},
+            }
+            reminders[slot_key] = (
+                max(gap[0] - meal_order_lead, now),
+                functools.partial(send_reminder, slot_key, user_id, reminder_message, event)
+            )
+            continue
+        
+        # No time to eat in the window: remind before the next meeting block starts
+        block_start = busy.next_busy_start(max(window_start, now))
+        if block_start is None or block_start <= now or block_start >= window_end:
+            continue
+        
+        meetings = calendar_api.get_events_for_range(user_id, block_start, block_start)
+        event = next((meeting for meeting in meetings
+                      if not meeting.all_day and meeting.local_start == block_start), None)
+        if event is None:
+            continue
+        
+        reminder_key = f"{user_id}_{event.id}"
+        if reminder_key in active_reminders:
+            continue
+        
+        event_name = event.summary or 'your meeting'
+        event_time_str = event.local_start.strftime("%I:%M %p")
+        reminder_message = f"I noticed you have {event_name} at {event_time_str}. Would you like to order {meal_type} before your meeting starts?"
+        reminders[reminder_key] = (
+            max(block_start - meal_order_lead, now),
+            functools.partial(send_reminder, reminder_key, user_id, reminder_message, event.to_dict())
+        )
+    
+    # Warm the menu cache ahead of each meal reminder
+    for reminder_key, (reminder_time, _) in list(reminders.items()):
+        reminders[f"{reminder_key}_prefetch"] = (max(reminder_time - menu_prefetch_lead, now), prefetch_lunch_options)
+    
+    reminder_scheduler.replace_user(user_id, reminders)
+    planned_calendars[user_id] = plan_key
+
+def plan_user_reminders(user_id):
+    try:
+        plan_reminders(user_id)
+    except Exception as e:
+        print(f"Error planning reminders for {user_id}: {e}")
+
+def schedule_plan(user_id):
+    """Plan a user's reminders on their own worker, with their own deadline
+    
+    Planning may call the FreeBusy API, so each user gets a separate future
+    and a slow account only holds up its own reminders. Does nothing while
+    the user's previous plan is still running; the next sweep plans again.
+    """
+    with calendar_checks_lock:
+        running = calendar_checks.get(user_id)
+        if running is not None and not running[0].done():
+            return
+        future = calendar_executor.submit(plan_user_reminders, user_id)
+        calendar_checks[user_id] = (future, time.monotonic() + calendar_check_timeout)
+
+calendar_api.add_change_listener(schedule_plan)
+
+def sync_user_calendars(user_ids):
+    """Sync a batch of users' calendars, then plan each user's reminders separately"""
+    # One batched request per 50 users; every Calendar API request is bounded by CALENDAR_HTTP_TIMEOUT
+    errors = calendar_api.sync_many(user_ids)
+    for user_id, error in errors.items():
+        print(f"Error syncing calendar for {user_id}: {error}")
+    
+    for user_id in user_ids:
+        # Re-plan when the day rolls over even if nothing changed
+        schedule_plan(user_id)
+
+def wait_for_calendar_checks(checks, kind):
+    """Wait for each user's future until their own deadline, reporting per user
+    
+    Finished entries are removed from `checks`. Unfinished ones stay, so
+    the user is skipped until their check ends.
+    """
+    with calendar_checks_lock:
+        pending = dict(checks)
+    if not pending:
+        return
+    last_deadline = max(deadline for _, deadline in pending.values())
+    concurrent.futures.wait({future for future, _ in pending.values()},
+                            timeout=max(0, last_deadline - time.monotonic()))
+    
+    now = time.monotonic()
+    for user_id, (future, deadline) in pending.items():
+        if not future.done():
+            if now >= deadline:
+                print(f"Calendar {kind} for {user_id} did not finish within {calendar_check_timeout}s")
+            continue
+        with calendar_checks_lock:
+            if checks.get(user_id, (None,))[0] is future:
+                del checks[user_id]
+        if future.exception() is not None:
+            print(f"Error in calendar {kind} for {user_id}: {future.exception()}")
 
 def check_calendar_and_notify():
-    """Background task to check calendar and send food ordering reminders"""
+    """Background task that keeps calendars synced and meal reminders scheduled"""
     
     # TESTING: Set this to True to enable test mode
     test_mode = False  # Changed to False by default, will be enabled conditionally
@@ -280,148 +569,43 @@ def check_calendar_and_notify():
             # Check if there are any users with calendar credentials
             users_with_credentials = False
             
-            # For each user
-            for user_id in user_state:
-                print(f"Checking calendar for user {user_id}")
-                
+            # Group users into batched API calls; each user's planning then gets its own future and deadline
+            due_users = []
+            active_users = conversations.active_users()
+            for user_id in active_users:
                 # Check if we have calendar access for this user
-                if calendar_api.has_credentials(user_id):
-                    users_with_credentials = True
-                    print(f"User {user_id} has calendar credentials")
-                    # Get events for today
-                    events = calendar_api.get_todays_events(user_id)
-                    print(f"Found {len(events)} events for today")
-                    
-                    # Define meal time ranges
-                    lunch_start = datetime.time(11, 0)  # 11:00 AM
-                    lunch_end = datetime.time(14, 0)    # 2:00 PM
-                    dinner_start = datetime.time(17, 0) # 5:00 PM
-                    dinner_end = datetime.time(20, 0)   # 8:00 PM
-                    
-                    # Check for upcoming meal time meetings
-                    for event in events:
-                        event_id = event.get('id')
-                        print(f"Processing event: {event.get('summary', 'Unnamed event')}")
-                        
-                        # Skip all-day events or events without start times
-                        if 'dateTime' not in event.get('start', {}):
-                            print("Skipping all-day event")
-                            continue
-                            
-                        start_time = parser.parse(event.get('start', {}).get('dateTime'))
-                        print(f"Event starts at: {start_time}")
-                        
-                        # Skip events that have already ended
-                        if start_time < now:
-                            print("Skipping past event")
-                            continue
-                        
-                        # Get the event's local time values
-                        event_time = start_time.time()
-                        
-                        # Determine if this is during a meal time
-                        is_lunch_time = lunch_start <= event_time <= lunch_end
-                        is_dinner_time = dinner_start <= event_time <= dinner_end
-                        is_meal_time = is_lunch_time or is_dinner_time
-                        
-                        print(f"Meal time check: lunch={is_lunch_time}, dinner={is_dinner_time}, any={is_meal_time}")
-                        
-                        # Check if this is a meal time event and we haven't reminded yet
-                        reminder_key = f"{user_id}_{event_id}"
-                        
-                        if is_meal_time and reminder_key not in active_reminders:
-                            print(f"Need to send reminder for event: {event.get('summary')}")
-                            # Calculate reminder time (1 hour before event)
-                            reminder_time = start_time - datetime.timedelta(hours=1)
-                            
-                            # If it's time to remind
-                            if now >= reminder_time and now <= start_time:
-                                # Create reminder message
-                                event_name = event.get('summary', 'your meeting')
-                                event_time_str = start_time.strftime("%I:%M %p")
-                                meal_type = "lunch" if is_lunch_time else "dinner"
-                                reminder_message = f"I noticed you have {event_name} at {event_time_str}. Would you like to order {meal_type} before your meeting starts?"
-                                
-                                print(f"Sending reminder: {reminder_message}")
-                                # Send reminder through socket
-                                socketio.emit('reminder', {
-                                    'message': reminder_message,
-                                    'user_id': user_id,
-                                    'event': event
-                                })
-                                
-                                # Mark as reminded
-                                active_reminders[reminder_key] = now
-                                
-                                # Log that we sent a reminder
-                                print(f"Sent {meal_type} reminder for event {event_name} at {event_time_str}")
-                    
-                    # Also check for general meal times when no meetings but user might want to eat
-                    current_time = now.time()
-                    
-                    # For general mealtime reminders, we use a different key format
-                    general_lunch_key = f"{user_id}_general_lunch_{now.strftime('%Y-%m-%d')}"
-                    general_dinner_key = f"{user_id}_general_dinner_{now.strftime('%Y-%m-%d')}"
-                    
-                    # Check if it's around lunchtime (11:30 AM) and we haven't reminded yet
-                    lunch_time_check = datetime.time(11, 30) <= current_time <= datetime.time(11, 45)
-                    
-                    if lunch_time_check and general_lunch_key not in active_reminders:
-                        # Check if user has any meetings during lunch hours
-                        has_lunch_meetings = any(
-                            lunch_start <= parser.parse(event.get('start', {}).get('dateTime', '2099-01-01T00:00:00')).time() <= lunch_end
-                            for event in events if 'dateTime' in event.get('start', {})
-                        )
-                        
-                        # If no lunch meetings, send a general lunch reminder
-                        if not has_lunch_meetings:
-                            reminder_message = "It's almost lunchtime. Would you like me to suggest some food options for delivery?"
-                            
-                            print(f"Sending general lunch reminder: {reminder_message}")
-                            socketio.emit('reminder', {
-                                'message': reminder_message,
-                                'user_id': user_id,
-                                'event': {'summary': 'Lunch Break', 'start': {'dateTime': (now + datetime.timedelta(minutes=30)).isoformat()}}
-                            })
-                            
-                            # Mark as reminded
-                            active_reminders[general_lunch_key] = now
-                            print("Sent general lunch reminder")
-                    
-                    # Similar check for dinner time
-                    dinner_time_check = datetime.time(17, 45) <= current_time <= datetime.time(18, 0)
-                        
-                    if dinner_time_check and general_dinner_key not in active_reminders:
-                        # Check if user has any meetings during dinner hours
-                        has_dinner_meetings = any(
-                            dinner_start <= parser.parse(event.get('start', {}).get('dateTime', '2099-01-01T00:00:00')).time() <= dinner_end
-                            for event in events if 'dateTime' in event.get('start', {})
-                        )
-                        
-                        # If no dinner meetings, send a general dinner reminder
-                        if not has_dinner_meetings:
-                            reminder_message = "It's approaching dinner time. Would you like me to suggest some food options for delivery?"
-                            
-                            print(f"Sending general dinner reminder: {reminder_message}")
-                            socketio.emit('reminder', {
-                                'message': reminder_message,
-                                'user_id': user_id,
-                                'event': {'summary': 'Dinner Time', 'start': {'dateTime': (now + datetime.timedelta(minutes=15)).isoformat()}}
-                            })
-                            
-                            # Mark as reminded
-                            active_reminders[general_dinner_key] = now
-                            print("Sent general dinner reminder")
-                else:
+                if not calendar_api.has_credentials(user_id):
                     print(f"User {user_id} does not have calendar credentials")
+                    continue
+                
+                users_with_credentials = True
+                # A user whose previous sync or plan is still running is skipped this round
+                with calendar_checks_lock:
+                    running = [checks[user_id][0] for checks in (calendar_syncs, calendar_checks) if user_id in checks]
+                if any(not future.done() for future in running):
+                    print(f"Calendar check for {user_id} still running, skipping")
+                    continue
+                due_users.append(user_id)
+            
+            for i in range(0, len(due_users), BATCH_LIMIT):
+                batch_users = due_users[i:i + BATCH_LIMIT]
+                future = calendar_executor.submit(sync_user_calendars, batch_users)
+                deadline = time.monotonic() + calendar_check_timeout
+                with calendar_checks_lock:
+                    for user_id in batch_users:
+                        calendar_syncs[user_id] = (future, deadline)
+            
+            # Syncs hand each user's planning to its own future, so wait for those after the syncs
+            wait_for_calendar_checks(calendar_syncs, 'sync')
+            wait_for_calendar_checks(calendar_checks, 'plan')
             
             # If no users have credentials, enable test mode temporarily
-            if not users_with_credentials and len(user_state) > 0:
+            if not users_with_credentials and active_users:
                 print("No users have calendar credentials, activating test mode temporarily")
                 # Use test mode until real calendar credentials are available
                 test_mode = True
                 
-                for user_id in user_state:
+                for user_id in active_users:
                     # Create a fake event for testing
                     fake_event = {
                         'id': 'fake_test_event_' + str(int(time.time())),
@@ -462,13 +646,13 @@ def check_calendar_and_notify():
             import traceback
             traceback.print_exc()
         
-        # Sleep interval
+        # Sleep interval; reminders themselves fire from reminder_scheduler on time
         if test_mode:
             print("TESTING MODE: Checking calendar every 60 seconds...")
             time.sleep(60)  # Check every minute in test mode
         else:
-            # Sleep for 5 minutes before checking again in normal mode
-            time.sleep(300)
+            # Poll for calendar changes every 5 minutes by default in normal mode
+            time.sleep(calendar_poll_interval)
 
 @app.route('/api/authorize/google', methods=['GET'])
 def authorize_google():
@@ -487,6 +671,8 @@ def google_callback():
     code = request.args.get('code')
     user_id = request.args.get('state', 'default_user')
     calendar_api.exchange_code_for_token(code, user_id)
+    # Newly connected users are active, so the calendar sweep picks them up
+    conversations.touch(user_id)
     
     # Schedule a welcome reminder 10 seconds after authentication
     def send_welcome_reminder():
@@ -495,45 +681,28 @@ def google_callback():
         res = []
 
         try:
-            # Get the user's calendar events
-            events = calendar_api.get_todays_events(user_id)
-            print(events)
-            
             # Current time
             now = datetime.datetime.now()
             current_time_str = now.strftime("%I:%M %p")
             
-            # Define lunch time range
-            lunch_start = datetime.time(11, 0)
-            lunch_end = datetime.time(14, 0)
-            
-            # Look for meetings during lunch hours
-            lunch_meetings = []
-            for event in events:
-                if 'dateTime' in event.get('start', {}):
-                    start_time = parser.parse(event.get('start', {}).get('dateTime'))
-                    
-                    # Check if event is today
-                    if start_time.date() == now.date():
-                        # Check if event is during lunch hours
-                        event_time = start_time.time()
-                        if lunch_start <= event_time <= lunch_end:
-                            lunch_meetings.append(event)
+            # Look for meetings overlapping lunch hours today using the busy-interval index
+            lunch_start, lunch_end = (datetime.datetime.combine(now.date(), moment) for moment in MEAL_WINDOWS['lunch'])
+            lunch_blocks = calendar_api.get_busy_index(user_id).busy_between(lunch_start, lunch_end)
+            lunch_meetings = [
+                event for event in calendar_api.get_events_for_range(user_id, lunch_start, lunch_end)
+                if not event.all_day
+            ]
+            print(f"Found {len(lunch_meetings)} lunch meetings for {user_id} today")
             
             # Create welcome message based on actual calendar
-            if lunch_meetings:
+            if lunch_blocks:
 
-                res = asyncio.run(find_2_lunch_options())["menu_items"]
+                res = async_runner.run(find_2_lunch_options(), MENU_SEARCH_TIMEOUT)["menu_items"]
                 items = ",".join([item.get("item_name") for item in res])
 
-                # Sort meetings by start time
-                lunch_meetings.sort(key=lambda x: parser.parse(x.get('start', {}).get('dateTime')))
-                
                 # Get time range of meetings
-                first_meeting = lunch_meetings[0]
-                last_meeting = lunch_meetings[-1]
-                first_time = parser.parse(first_meeting.get('start', {}).get('dateTime'))
-                last_time = parser.parse(last_meeting.get('start', {}).get('dateTime'))
+                first_time = lunch_blocks[0][0]
+                last_time = lunch_blocks[-1][1]
                 
                 # Format meeting time range
                 first_time_str = first_time.strftime("%I:%M %p")
@@ -547,7 +716,7 @@ def google_callback():
                     meeting_desc = f"a meeting at {first_time_str}"
                 
                 welcome_message = f"It's 11:00 AM, I noticed you have {meeting_desc}. Time to order food! I found two options for you: {items}. Would you like to see the menus?"
-                event = lunch_meetings[0]  # Use the first meeting as the reference event
+                event = lunch_meetings[0].to_dict()  # Use the first meeting as the reference event
             else:
                 # No lunch meetings found, create a generic message
                 current_time_str = "11:00 AM"
@@ -601,6 +770,19 @@ def auth_status():
     is_authenticated = calendar_api.has_credentials(user_id)
     return jsonify({'authenticated': is_authenticated})
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    chat_queued, chat_running = chat_executor.stats()
+    return jsonify({
+        'response_cache': response_cache.stats(),
+        'chat': {'queued': chat_queued, 'running': chat_running},
+        'highrise_circuit_open': highrise_client.breaker.is_open,
+        'active_users': len(conversations),
+        'pending_reminders': reminder_scheduler.pending_count(),
+        'menu_cache': lunch_options_cache.stats(),
+        'pending_orders': order_jobs.pending_count(),
+    })
+
 @app.route('/api/calendar/events', methods=['GET'])
 def get_calendar_events():
     user_id = request.args.get('user_id', 'default_user')
@@ -612,12 +794,13 @@ def get_calendar_events():
         return jsonify({'error': 'Calendar not connected'}), 401
     
     try:
-        events = []
         now = datetime.datetime.now()
         
         # Get events based on range_type
         if range_type == 'today':
-            events = calendar_api.get_todays_events(user_id)
+            start_of_day = datetime.datetime.combine(now.date(), datetime.time(0, 0, 0))
+            end_of_day = datetime.datetime.combine(now.date(), datetime.time(23, 59, 59))
+            events = calendar_api.iter_events(user_id, start_of_day, end_of_day)
             date_info = now.strftime('%A, %B %d, %Y')
         elif range_type == 'week':
             # Calculate start and end of week
@@ -625,49 +808,42 @@ def get_calendar_events():
             start_of_week = datetime.datetime.combine(start_of_week.date(), datetime.time(0, 0, 0))
             end_of_week = start_of_week + datetime.timedelta(days=6, hours=23, minutes=59, seconds=59)
             
-            events = calendar_api.get_events_for_range(user_id, start_of_week, end_of_week)
+            events = calendar_api.iter_events(user_id, start_of_week, end_of_week)
             date_info = f"Week of {start_of_week.strftime('%b %d')} - {end_of_week.strftime('%b %d, %Y')}"
         elif range_type == 'upcoming':
-            events = calendar_api.get_upcoming_events(user_id, days)
+            start_of_today = datetime.datetime.combine(now.date(), datetime.time(0, 0, 0))
+            end_date = start_of_today + datetime.timedelta(days=days, hours=23, minutes=59, seconds=59)
+            events = calendar_api.iter_events(user_id, now, end_date)
             date_info = f"Next {days} days"
         else:
             return jsonify({'error': 'Invalid range type'}), 400
         
-        # Debug log to help troubleshoot
-        print(f"Range: {range_type}, Events found: {len(events)}")
-        for event in events:
-            if 'dateTime' in event.get('start', {}):
-                start_time = parser.parse(event.get('start', {}).get('dateTime'))
-                print(f"Event: {event.get('summary')}, Date: {start_time.date()}, Time: {start_time.strftime('%H:%M')}")
-        
-        # Format events for display
+        # Format events for display as they stream in; iter_events yields them
+        # ordered by start time, so neither list needs sorting afterwards
         formatted_events = []
         events_by_date = {}
         
+        today = now.strftime('%Y-%m-%d')
         for event in events:
-            # Skip events without dateTime (all-day events)
-            if 'dateTime' not in event.get('start', {}):
+            # Skip all-day events
+            if event.all_day:
                 continue
                 
-            # Parse event times
-            start_time = parser.parse(event.get('start', {}).get('dateTime'))
-            end_time = parser.parse(event.get('end', {}).get('dateTime')) if 'dateTime' in event.get('end', {}) else None
-            
-            # Get event date for grouping
-            event_date = start_time.date()
-            today = now.date()
+            start_time = event.start
+            end_time = event.end
             
             # For the 'today' range, double-check we're including only today's events
-            if range_type == 'today' and event_date != today:
-                print(f"Skipping event {event.get('summary')} because {event_date} is not today ({today})")
+            if range_type == 'today' and event.date_key != today:
+                print(f"Skipping event {event.summary} because {event.date_key} is not today ({today})")
                 continue
                 
             # Format event data
+            event_date = start_time.date()
             formatted_event = {
-                'id': event.get('id'),
-                'summary': event.get('summary', 'Untitled Event'),
-                'location': event.get('location', ''),
-                'date': event_date.strftime('%Y-%m-%d'),
+                'id': event.id,
+                'summary': event.summary or 'Untitled Event',
+                'location': event.location,
+                'date': event.date_key,
                 'dateFormatted': event_date.strftime('%A, %B %d'),
                 'start': {
                     'dateTime': start_time.isoformat(),
@@ -687,7 +863,7 @@ def get_calendar_events():
             formatted_events.append(formatted_event)
             
             # Group events by date for multi-day views
-            date_key = event_date.strftime('%Y-%m-%d')
+            date_key = event.date_key
             if date_key not in events_by_date:
                 events_by_date[date_key] = {
                     'date': date_key,
@@ -697,17 +873,10 @@ def get_calendar_events():
             
             events_by_date[date_key]['events'].append(formatted_event)
         
-        # Sort events by start time
-        formatted_events.sort(key=lambda x: x['start']['dateTime'])
-        
-        # For multi-day views, sort the grouped events
-        for date_key in events_by_date:
-            events_by_date[date_key]['events'].sort(key=lambda x: x['start']['dateTime'])
-        
         # Sort the dates
         sorted_dates = sorted(events_by_date.values(), key=lambda x: x['date'])
         
-        print(f"Formatted events count: {len(formatted_events)}")
+        print(f"Range: {range_type}, Formatted events count: {len(formatted_events)}")
         print(f"Events by date groups: {len(sorted_dates)}")
         
         return jsonify({
@@ -740,5 +909,16 @@ if __name__ == '__main__':
     calendar_thread = threading.Thread(target=check_calendar_and_notify, daemon=True)
     calendar_thread.start()
     
+    # Stop the shared event loop on exit; atexit runs handlers in reverse, so this goes after closing the browser
+    atexit.register(async_runner.shutdown)
+    
+    # Resume orders queued before a restart
+    order_jobs.start()
+    
+    # Launch the browser for agent runs now rather than on the first lunch search
+    if not MOCK_BROWSER_AGENT:
+        browser_pool.warm_up()
+        atexit.register(browser_pool.close)
+    
     # Start the Flask app
     socketio.run(app, debug=True, host='0.0.0.0', port=8080, allow_unsafe_werkzeug=True)
@@ -0,0 +1,213 @@
+"""Benchmark the lunch search and ordering pipelines on replayed browser agent runs
+
+Runs search_lunch_options and order_food from api/browser.py in
+BROWSER_AGENT_MODE=replay. The real Agent and Controller execute the
+recorded model outputs in headless Chromium from the browser pool, with
+`--slots` contexts, against a local page, so no site or LLM is used and
+the results are parsed exactly as they would be live. Reports agent step
+counts, per-run wall time and throughput at the requested concurrency.
+With --time-scale above 0 each step also waits its recorded LLM and page
+timings, scaled, on top of the agent's own overhead.
+
+Recordings come from running the app with BROWSER_AGENT_MODE=record. When
+--recordings is not given, synthetic recordings with typical step counts
+and timings are generated in a temporary directory instead. Needs
+Playwright's Chromium (`playwright install chromium`).
+
+Usage:
+    python benchmarks/bench_browser_agent.py [--recordings DIR] [--runs 20] [--concurrency 4]
+        [--slots 2] [--time-scale 0] [--jitter 0.25] [--seed 0] [--json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FLOWS = ('lunch_options', 'order_food')
+
+SYNTHETIC_STEPS = {
+    # flow: (fewest steps, most steps)
+    'lunch_options': (6, 10),
+    'order_food': (9, 13),
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def synthetic_step(number, started, rng, action, done=None):
+    decide = rng.lognormvariate(math.log(3.5), 0.35)
+    act = rng.lognormvariate(math.log(1.2), 0.5)
+    if done is not None:
+        result = {'is_done': True, 'success': True, 'extracted_content': done, 'error': None, 'include_in_memory': True}
+    else:
+        result = {'is_done': False, 'success': None, 'extracted_content': f"Step {number}", 'error': None,
+                  'include_in_memory': True}
+    item = {
+        'model_output': {
+            'current_state': {'evaluation_previous_goal': 'Success', 'memory': '', 'next_goal': f"Step {number}"},
+            'action': [action],
+        },
+        'result': [result],
+        'state': {'tabs': [], 'screenshot': None, 'interacted_element': [None],
+                  'url': 'https://www.doordash.com/home', 'title': 'DoorDash'},
+        'metadata': {'step_start_time': started, 'step_end_time': started + decide + act,
+                     'input_tokens': 4000 + 600 * number, 'step_number': number},
+    }
+    step = {'step': number, 'decide_seconds': decide, 'act_seconds': act, 'input_tokens': 4000 + 600 * number}
+    return item, step, started + decide + act
+
+
+def write_synthetic_recordings(directory, mock_items, count=3, seed=0):
+    """A few recordings per flow, shaped like what AgentRecorder saves"""
+    rng = random.Random(seed)
+    for flow in FLOWS:
+        os.makedirs(os.path.join(directory, flow))
+        for index in range(count):
+            steps, history = [], []
+            started = 1_700_000_000.0
+            total = rng.randint(*SYNTHETIC_STEPS[flow])
+            for number in range(1, total):
+                action = rng.choice([
+                    {'go_to_url': {'url': 'https://www.doordash.com/home'}},
+                    {'click_element': {'index': rng.randrange(50)}},
+                    {'input_text': {'index': rng.randrange(50), 'text': 'lunch'}},
+                    {'scroll_down': {'amount': None}},
+                ])
+                item, step, started = synthetic_step(number, started, rng, action)
+                history.append(item)
+                steps.append(step)
+
+            if flow == 'lunch_options':
+                done = json.dumps(mock_items)
+                action = {'done': {**mock_items, 'success': True}}
+            else:
+                done = 'Order placed'
+                action = {'done': {'text': done, 'success': True}}
+            item, step, _ = synthetic_step(total, started, rng, action, done=done)
+            history.append(item)
+            steps.append(step)
+
+            with open(os.path.join(directory, flow, f"synthetic{index}.json"), 'w', encoding='utf-8') as f:
+                json.dump({'name': flow, 'recorded_at': 'synthetic', 'steps': steps, 'history': history}, f)
+
+
+async def bench_flow(browser, flow, runs, concurrency):
+    item = browser.MOCK_ITEMS['menu_items'][0]
+    calls = {
+        'lunch_options': lambda: browser.search_lunch_options(),
+        'order_food': lambda: browser.order_food(item['restaurant_url'], item['item_name']),
+    }
+
+    latencies, errors = [], 0
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with gate:
+            started = time.perf_counter()
+            try:
+                await calls[flow]()
+            except Exception as e:
+                errors += 1
+                print(f"{flow} run failed: {e}", file=sys.stderr)
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(runs)))
+    wall = time.perf_counter() - started
+    return latencies, errors, wall
+
+
+def run_flow(browser, flow, args, steps):
+    """Benchmark one flow; `steps` collects the step count of each replayed run"""
+    latencies, errors, wall = asyncio.run(bench_flow(browser, flow, args.runs, args.concurrency))
+    return {
+        'runs': args.runs,
+        'errors': errors,
+        'error_rate': errors / args.runs,
+        'steps_mean': statistics.mean(steps) if steps else None,
+        'steps_max': max(steps) if steps else None,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+        'max_ms': max(latencies) * 1000 if latencies else None,
+        'throughput_per_s': len(latencies) / wall,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--recordings', help='directory of recordings; synthetic ones are used if omitted')
+    arg_parser.add_argument('--flow', choices=FLOWS, action='append', help='flow to run, repeatable (default: all)')
+    arg_parser.add_argument('--runs', type=int, default=20)
+    arg_parser.add_argument('--concurrency', type=int, default=4)
+    arg_parser.add_argument('--slots', type=int, default=2, help='browser contexts shared by concurrent runs')
+    arg_parser.add_argument('--time-scale', type=float, default=0.0,
+                            help='multiplier on recorded step durations waited as LLM and page latency (0: none)')
+    arg_parser.add_argument('--jitter', type=float, default=0.25, help='lognormal shape of per-step timing noise')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = arg_parser.parse_args()
+
+    directory = args.recordings or tempfile.mkdtemp(prefix='agent-recordings-')
+    os.environ.update({
+        'MOCK_BROWSER_AGENT': 'False',
+        'BROWSER_AGENT_MODE': 'replay',
+        'AGENT_RECORDINGS_DIR': directory,
+        'BROWSER_CDP_URL': '',
+        'BROWSER_POOL_SIZE': str(args.slots),
+    })
+    # The agent's LLM client is built at import time but never called during replay
+    os.environ.setdefault('OPENAI_API_KEY', 'replay')
+
+    from api import browser
+    from api.agent_replay import AgentReplayer
+    from api.async_runner import async_runner
+
+    if not args.recordings:
+        write_synthetic_recordings(directory, browser.MOCK_ITEMS, seed=args.seed)
+    browser.agent_replayer = AgentReplayer(directory, browser.browser_pool, time_scale=args.time_scale,
+                                           jitter=args.jitter, seed=args.seed)
+    steps_by_flow = {flow: [] for flow in FLOWS}
+    browser.agent_replayer.add_listener(lambda name, history: steps_by_flow[name].append(history.number_of_steps()))
+
+    results = {}
+    try:
+        for flow in args.flow or FLOWS:
+            if not browser.agent_replayer.recordings(flow):
+                print(f"No recordings for {flow} in {directory}, skipping", file=sys.stderr)
+                continue
+            results[flow] = run_flow(browser, flow, args, steps_by_flow[flow])
+    finally:
+        browser.browser_pool.close()
+        async_runner.shutdown()
+
+    if args.json:
+        print(json.dumps({'config': vars(args) | {'recordings': directory}, 'results': results}, indent=2))
+        return
+
+    print(f"{args.runs} runs per flow, concurrency {args.concurrency}, {browser.browser_pool.size} browser slots, "
+          f"time scale {args.time_scale}, recordings in {directory}")
+    for flow, result in results.items():
+        if result['p50_ms'] is None:
+            print(f"{flow:14} all {result['errors']} runs failed")
+            continue
+        print(f"{flow:14} steps {result['steps_mean']:5.1f} (max {result['steps_max']})  "
+              f"p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  max {result['max_ms']:8.1f} ms  "
+              f"{result['throughput_per_s']:6.2f} runs/s  "
+              f"errors {result['error_rate']:.0%}")
+
+
+if __name__ == '__main__':
+    main()
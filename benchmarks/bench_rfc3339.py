@@ -0,0 +1,88 @@
+"""Compare dateutil with rfc3339.parse_datetime on a synthetic calendar payload
+
+Builds a 10k-event day/week payload shaped like Google Calendar's
+events().list items and times parsing every start/end timestamp with
+dateutil, the fast path without its cache, and the fast path with a cold
+and a warm cache.
+
+Usage:
+    python benchmarks/bench_rfc3339.py [--events 10000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from dateutil import parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rfc3339 import parse_datetime  # noqa: E402
+
+
+def build_payload(count, seed=0):
+    """Events spread over a week on 15-minute boundaries, in a few time zones"""
+    rng = random.Random(seed)
+    week_start = datetime(2025, 3, 3, 8, 0)
+    zones = [timezone.utc, timezone(timedelta(hours=-7)), timezone(timedelta(hours=-4)), timezone(timedelta(hours=1))]
+    items = []
+    for i in range(count):
+        start = week_start + timedelta(days=rng.randrange(7), minutes=15 * rng.randrange(48))
+        end = start + timedelta(minutes=rng.choice([15, 30, 45, 60, 90]))
+        tz = rng.choice(zones)
+        if tz is timezone.utc:
+            start_str = start.strftime('%Y-%m-%dT%H:%M:%SZ')
+            end_str = end.strftime('%Y-%m-%dT%H:%M:%SZ')
+        else:
+            start_str = start.replace(tzinfo=tz).isoformat()
+            end_str = end.replace(tzinfo=tz).isoformat()
+        items.append({'id': f'event{i}', 'start': {'dateTime': start_str}, 'end': {'dateTime': end_str}})
+    return items
+
+
+def time_parse(parse, items, repeat, before_each=None):
+    best = None
+    for _ in range(repeat):
+        if before_each:
+            before_each()
+        started = time.perf_counter()
+        for item in items:
+            parse(item['start']['dateTime'])
+            parse(item['end']['dateTime'])
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--events', type=int, default=10000)
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    items = build_payload(args.events)
+
+    # Both parsers must agree before their speed means anything
+    for item in items:
+        for field in ('start', 'end'):
+            value = item[field]['dateTime']
+            assert parse_datetime(value) == parser.parse(value), value
+
+    timestamps = args.events * 2
+    results = [
+        ('dateutil.parser.parse', time_parse(parser.parse, items, args.repeat)),
+        ('parse_datetime (uncached)', time_parse(parse_datetime.__wrapped__, items, args.repeat)),
+        ('parse_datetime (cold cache)', time_parse(parse_datetime, items, args.repeat, parse_datetime.cache_clear)),
+        ('parse_datetime (warm cache)', time_parse(parse_datetime, items, args.repeat)),
+    ]
+
+    baseline = results[0][1]
+    print(f"{timestamps} timestamps from {args.events} events, best of {args.repeat}")
+    for name, elapsed in results:
+        print(f"{name:30} {elapsed * 1000:9.2f} ms  {elapsed / timestamps * 1e6:7.2f} us/ts  {baseline / elapsed:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
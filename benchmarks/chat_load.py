@@ -0,0 +1,326 @@
+"""Load test the Socket.IO chat path against a stub Highrise API
+
+Starts a local stub of the Highrise chat/completions API with configurable
+latency, runs the app against it in a subprocess, then connects `--clients`
+Socket.IO clients. Each client sends `--messages` chat messages with
+message IDs one after another and waits for each `response` event. This
+exercises handle_message, the chat worker queue, generate_response
+streaming and the response emit.
+
+Reports round-trip latency (message sent to `response` received) and time
+to the first `response_chunk` as p50/p95/p99. It also reports throughput
+and the error rate. Errors are timeouts, connection failures and replies
+the app flags with `error`, such as busy or LLM failure replies.
+
+The app subprocess inherits the environment, so settings such as
+CHAT_WORKERS or CHAT_QUEUE_SIZE can be varied between runs. Use --url to
+target a server that is already running. It must point HIGHRISE_BASE_URL
+at a stub or real API itself.
+
+Usage:
+    python benchmarks/chat_load.py [--clients 50] [--messages 5] [--llm-latency 0.5] [--chunks 10]
+        [--chunk-interval 0.02] [--json] [--output results.json]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"App exited with status {process.returncode} before it started listening")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def stub_handler(latency, jitter, chunks, chunk_interval, error_rate, seed):
+    """Request handler class for a chat/completions stub with the given timing"""
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class StubHighrise(BaseHTTPRequestHandler):
+        # HTTP/1.1 keeps connections alive, so the app's pooled session is exercised as in production
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            with rng_lock:
+                delay = max(0.0, rng.gauss(latency, jitter)) if jitter else latency
+                fail = rng.random() < error_rate
+            time.sleep(delay)
+
+            if fail:
+                self._send_json(503, {'error': 'stub failure'})
+                return
+
+            last = next((message['content'] for message in reversed(payload.get('messages', []))
+                         if message['role'] == 'user'), '')
+            words = f"Stub reply to: {last}".split()
+            parts = [' '.join(words[i::chunks]) for i in range(min(chunks, len(words)))] or ['']
+
+            if not payload.get('stream'):
+                self._send_json(200, {'choices': [{'message': {'content': ' '.join(parts)}}]})
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for index, part in enumerate(parts):
+                text = part if index == 0 else ' ' + part
+                self._write_chunk(f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n")
+                time.sleep(chunk_interval)
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, text):
+            data = text.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return StubHighrise
+
+
+class SimulatedUser:
+    """One Socket.IO client sending messages one at a time and timing each reply"""
+
+    def __init__(self, index, url, args, results):
+        self.user_id = f"bench-user-{index}"
+        self.index = index
+        self.url = url
+        self.args = args
+        self.results = results
+        self.client = socketio.Client(reconnection=False)
+        self._pending = None  # the message awaiting its reply
+        self._lock = threading.Lock()
+        self.client.on('response', self._on_response)
+        self.client.on('response_chunk', self._on_chunk)
+
+    def _on_chunk(self, data):
+        with self._lock:
+            pending = self._pending
+            if pending and data.get('message_id') == pending['message_id'] and pending['first_chunk'] is None:
+                pending['first_chunk'] = time.perf_counter()
+
+    def _on_response(self, data):
+        with self._lock:
+            pending = self._pending
+            if pending and data.get('message_id') == pending['message_id']:
+                pending['received'] = time.perf_counter()
+                pending['reply'] = data.get('response', '')
+                pending['error'] = data.get('error', False)
+                pending['done'].set()
+
+    def run(self, start_at):
+        time.sleep(max(0.0, start_at - time.monotonic()))
+        try:
+            self.client.connect(self.url, wait_timeout=self.args.timeout)
+        except Exception as e:
+            self.results.record_error('connect', e, count=self.args.messages)
+            return
+
+        try:
+            for seq in range(self.args.messages):
+                text = ("What should I eat for lunch today?" if self.args.same_message
+                        else f"What should I eat for lunch today? ({self.index}-{seq})")
+                pending = {'message_id': f"bench_{uuid.uuid4().hex}", 'first_chunk': None,
+                           'received': None, 'reply': None, 'error': False, 'done': threading.Event()}
+                with self._lock:
+                    self._pending = pending
+                sent = time.perf_counter()
+                try:
+                    self.client.emit('message', {'message': text, 'user_id': self.user_id,
+                                                 'message_id': pending['message_id']})
+                except Exception as e:
+                    self.results.record_error('send', e, count=self.args.messages - seq)
+                    return
+                if not pending['done'].wait(self.args.timeout):
+                    self.results.record_error('timeout')
+                elif pending['error']:
+                    self.results.record_error('error_reply', pending['reply'])
+                else:
+                    first_chunk = pending['first_chunk'] or pending['received']
+                    self.results.record(pending['received'] - sent, first_chunk - sent)
+                if self.args.think_time:
+                    time.sleep(self.args.think_time)
+        finally:
+            self.client.disconnect()
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.first_chunk = []
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, latency, first_chunk):
+        with self._lock:
+            self.latencies.append(latency)
+            self.first_chunk.append(first_chunk)
+
+    def record_error(self, kind, detail=None, count=1):
+        with self._lock:
+            first = kind not in self.errors
+            self.errors[kind] = self.errors.get(kind, 0) + count
+        if detail is not None and first:
+            print(f"First {kind} error: {detail}", file=sys.stderr)
+
+    def summary(self, attempted, elapsed):
+        def ms(values, fraction):
+            value = percentile(values, fraction)
+            return value * 1000 if value is not None else None
+
+        errors = sum(self.errors.values())
+        return {
+            'attempted': attempted,
+            'completed': len(self.latencies),
+            'errors': errors,
+            'errors_by_kind': dict(self.errors),
+            'error_rate': errors / attempted if attempted else 0.0,
+            'duration_s': elapsed,
+            'throughput_per_s': len(self.latencies) / elapsed if elapsed else 0.0,
+            'latency_ms': {'p50': ms(self.latencies, 0.50), 'p95': ms(self.latencies, 0.95),
+                           'p99': ms(self.latencies, 0.99), 'max': ms(self.latencies, 1.0)},
+            'first_chunk_ms': {'p50': ms(self.first_chunk, 0.50), 'p95': ms(self.first_chunk, 0.95),
+                               'p99': ms(self.first_chunk, 0.99)},
+        }
+
+
+def start_app(port, highrise_url, log):
+    env = dict(os.environ)
+    env.update({
+        'HIGHRISE_BASE_URL': highrise_url,
+        'HIGHRISE_API_KEY': env.get('HIGHRISE_API_KEY', 'stub'),
+        'OPENAI_API_KEY': env.get('OPENAI_API_KEY', 'stub'),
+        'MOCK_BROWSER_AGENT': 'True',
+        'PYTHONUNBUFFERED': '1',
+    })
+    code = ("import app; app.socketio.run(app.app, host='127.0.0.1', port=%d, "
+            "allow_unsafe_werkzeug=True, log_output=False)" % port)
+    return subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--url', help='Socket.IO server to test instead of starting the app and stub')
+    arg_parser.add_argument('--clients', type=int, default=50)
+    arg_parser.add_argument('--messages', type=int, default=5, help='messages each client sends in turn')
+    arg_parser.add_argument('--ramp', type=float, default=2.0, help='seconds over which clients connect')
+    arg_parser.add_argument('--think-time', type=float, default=0.0, help='seconds between a reply and the next message')
+    arg_parser.add_argument('--timeout', type=float, default=60.0, help='seconds to wait for each reply')
+    arg_parser.add_argument('--same-message', action='store_true', help='send identical text, so replies can be cached')
+    arg_parser.add_argument('--llm-latency', type=float, default=0.5, help='stub seconds before the first token')
+    arg_parser.add_argument('--llm-jitter', type=float, default=0.1, help='standard deviation of the stub latency')
+    arg_parser.add_argument('--chunks', type=int, default=10, help='streamed chunks per stub reply')
+    arg_parser.add_argument('--chunk-interval', type=float, default=0.02, help='stub seconds between chunks')
+    arg_parser.add_argument('--llm-error-rate', type=float, default=0.0, help='fraction of stub calls answered 503')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--app-log', help='file for the app subprocess output (default: discarded)')
+    arg_parser.add_argument('--json', action='store_true', help='print results as JSON')
+    arg_parser.add_argument('--output', help='also write the JSON results to this file')
+    args = arg_parser.parse_args()
+
+    stub = app_process = log = None
+    try:
+        url = args.url
+        if url is None:
+            handler = stub_handler(args.llm_latency, args.llm_jitter, args.chunks, args.chunk_interval,
+                                   args.llm_error_rate, args.seed)
+            stub = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+            stub.daemon_threads = True
+            threading.Thread(target=stub.serve_forever, daemon=True, name='stub-highrise').start()
+
+            port = free_port()
+            log = open(args.app_log, 'w') if args.app_log else subprocess.DEVNULL
+            app_process = start_app(port, f"http://127.0.0.1:{stub.server_address[1]}", log)
+            wait_for_port(port, 60, app_process)
+            url = f"http://127.0.0.1:{port}"
+
+        results = Results()
+        users = [SimulatedUser(index, url, args, results) for index in range(args.clients)]
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=user.run, args=(started + args.ramp * index / max(1, args.clients),), daemon=True)
+            for index, user in enumerate(users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = results.summary(args.clients * args.messages, time.monotonic() - started)
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(10)
+        if stub is not None:
+            stub.shutdown()
+        if log not in (None, subprocess.DEVNULL):
+            log.close()
+
+    report = {'config': vars(args), 'results': summary}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    latency, first_chunk = summary['latency_ms'], summary['first_chunk_ms']
+
+    def fmt(value):
+        return f"{value:8.1f}" if value is not None else "     n/a"
+
+    print(f"{args.clients} clients x {args.messages} messages against {url}")
+    print(f"completed {summary['completed']}/{summary['attempted']}  errors {summary['error_rate']:.1%} "
+          f"{summary['errors_by_kind'] or ''}  throughput {summary['throughput_per_s']:.1f} msg/s")
+    print(f"round trip ms   p50 {fmt(latency['p50'])}  p95 {fmt(latency['p95'])}  p99 {fmt(latency['p99'])}  "
+          f"max {fmt(latency['max'])}")
+    print(f"first chunk ms  p50 {fmt(first_chunk['p50'])}  p95 {fmt(first_chunk['p95'])}  p99 {fmt(first_chunk['p99'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""Check batched Google Calendar syncs against a local multipart stub
+
+Runs a stub of the Calendar API's batch endpoint and its events and
+calendarList methods on a free local port, points GoogleCalendarAPI at it
+with GOOGLE_CALENDAR_BATCH_URI and GOOGLE_CALENDAR_API_URI, and syncs 60
+users with sync_many. The stub tells users apart by their bearer tokens
+and answers each part of a multipart/mixed batch with that user's data.
+It checks that:
+
+- every user's events land in their own cache, whatever their part's
+  position in the batch response
+- more than 50 requests are split into batches of at most 50 parts
+- a calendar with more pages than fit in one response is completed with
+  follow-up requests
+- a user with two selected calendars gets both synced
+- an incremental sync applies new events, and a 410 for an expired sync
+  token falls back to a full sync of that calendar
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python benchmarks/check_calendar_batch.py
+"""
+import email.parser
+import json
+import os
+import sys
+import tempfile
+import threading
+import urllib.parse
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+USERS = [f"user{index:02d}" for index in range(57)] + ['paged', 'multi', 'expired']
+PAGE_SIZE = 2
+
+
+def event(user_id, calendar_id, number):
+    start = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0) + timedelta(hours=number)
+    return {
+        'id': f"{user_id}-{calendar_id}-{number}",
+        'status': 'confirmed',
+        'summary': f"{user_id} meeting {number}",
+        'start': {'dateTime': start.isoformat() + 'Z'},
+        'end': {'dateTime': (start + timedelta(minutes=30)).isoformat() + 'Z'},
+    }
+
+
+class CalendarStub:
+    """In-memory Calendar API for a fixed set of users, served over HTTP
+
+    `events[user_id][calendar_id]` lists each calendar's events. Events
+    passed to `add_change` are returned by the next incremental sync of
+    their calendar, and `expire_sync_token` makes the next incremental
+    sync answer 410 Gone. Batch requests, their part counts and single
+    requests are counted.
+    """
+
+    def __init__(self):
+        self.events = {user_id: {'primary': [event(user_id, 'primary', 0)]} for user_id in USERS}
+        self.events['paged']['primary'] = [event('paged', 'primary', n) for n in range(5)]
+        self.events['multi']['team'] = [event('multi', 'team', 0), event('multi', 'team', 1)]
+        self.batch_parts = []
+        self.single_requests = 0
+        self._changes = {}
+        self._expired = set()
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.single_requests += 1
+                status, body = stub.answer(self.path, self.headers.get('Authorization', ''))
+                self._send(status, 'application/json', json.dumps(body))
+
+            def do_POST(self):
+                content_type = self.headers['Content-Type']
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                message = email.parser.BytesParser().parsebytes(
+                    f"Content-Type: {content_type}\r\n\r\n".encode('ascii') + data
+                )
+                parts = message.get_payload()
+                with stub._lock:
+                    stub.batch_parts.append(len(parts))
+
+                # Answer in reverse order; clients must match parts by Content-ID, not position
+                answers = []
+                for part in reversed(parts):
+                    request_line, _, rest = part.get_payload().partition('\n')
+                    headers = dict(
+                        line.split(': ', 1) for line in rest.split('\n') if ': ' in line
+                    )
+                    authorization = next((value for name, value in headers.items()
+                                          if name.lower() == 'authorization'), '')
+                    status, body = stub.answer(request_line.split(' ')[1], authorization)
+                    content_id = part['Content-ID'][1:-1]
+                    answers.append(
+                        "--batch_stub\r\nContent-Type: application/http\r\n"
+                        f"Content-ID: <response-{content_id}>\r\n\r\n"
+                        f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                        f"Content-Type: application/json\r\n\r\n{json.dumps(body)}\r\n"
+                    )
+                self._send(200, 'multipart/mixed; boundary=batch_stub', ''.join(answers) + "--batch_stub--\r\n")
+
+            def _send(self, status, content_type, text):
+                data = text.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True, name='stub-calendar').start()
+
+    def add_change(self, user_id, calendar_id, item):
+        with self._lock:
+            self.events[user_id][calendar_id].append(item)
+            self._changes.setdefault((user_id, calendar_id), []).append(item)
+
+    def expire_sync_token(self, user_id, calendar_id):
+        with self._lock:
+            self._expired.add((user_id, calendar_id))
+
+    def answer(self, path, authorization):
+        """Return (status, JSON body) for one API request made as the token's user"""
+        user_id = authorization[len('Bearer token-'):]
+        url = urllib.parse.urlparse(path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        segments = [urllib.parse.unquote(segment) for segment in url.path.split('/')]
+        with self._lock:
+            calendars = self.events.get(user_id)
+            if calendars is None:
+                return 401, {'error': {'code': 401, 'message': 'unknown token'}}
+
+            if segments[-1] == 'calendarList':
+                return 200, {'items': [{'id': calendar_id, 'primary': calendar_id == 'primary', 'selected': True}
+                                       for calendar_id in calendars]}
+
+            calendar_id = segments[-2]
+            if calendar_id not in calendars:
+                return 404, {'error': {'code': 404, 'message': 'not found'}}
+            if 'syncToken' in query:
+                if (user_id, calendar_id) in self._expired:
+                    self._expired.discard((user_id, calendar_id))
+                    return 410, {'error': {'code': 410, 'message': 'Sync token is no longer valid'}}
+                items = self._changes.pop((user_id, calendar_id), [])
+                return 200, {'items': items, 'nextSyncToken': f"sync-{user_id}-{calendar_id}-{len(items)}"}
+
+            offset = int(query.get('pageToken', 0))
+            size = int(query.get('maxResults', 250))
+            items = calendars[calendar_id]
+            page = {'items': items[offset:offset + size]}
+            if offset + size < len(items):
+                page['nextPageToken'] = str(offset + size)
+            else:
+                page['nextSyncToken'] = f"sync-{user_id}-{calendar_id}-full"
+            return 200, page
+
+    def reset_counts(self):
+        with self._lock:
+            self.batch_parts = []
+            self.single_requests = 0
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+def cached_ids(api, user_id, calendar_id='primary'):
+    calendar = api.event_cache.get(user_id)
+    with calendar.lock:
+        return sorted(calendar.calendars[calendar_id].events)
+
+
+def check_first_sync(api, stub):
+    errors = api.sync_many(USERS)
+    assert errors == {}, errors
+    # 60 calendar lists, then 61 first pages (multi has two calendars)
+    assert stub.batch_parts == [50, 10, 50, 11], f"batch sizes {stub.batch_parts}"
+    for user_id in USERS:
+        expected = sorted(item['id'] for item in stub.events[user_id]['primary'])
+        assert cached_ids(api, user_id) == expected, f"{user_id} cached {cached_ids(api, user_id)}"
+    assert cached_ids(api, 'multi', 'team') == ['multi-team-0', 'multi-team-1'], cached_ids(api, 'multi', 'team')
+    # paged's 5 events at 2 per page need 2 pages after the batched first one
+    assert stub.single_requests == 2, f"{stub.single_requests} follow-up requests"
+
+
+def check_incremental_sync_and_expired_token(api, stub):
+    stub.add_change('user01', 'primary', event('user01', 'primary', 1))
+    stub.expire_sync_token('expired', 'primary')
+    stub.add_change('expired', 'primary', event('expired', 'primary', 1))
+
+    errors = api.sync_many(USERS, force=True)
+    assert errors == {}, errors
+    # Calendar lists are not due again, so only the 61 incremental syncs are batched
+    assert stub.batch_parts == [50, 11], f"batch sizes {stub.batch_parts}"
+    assert cached_ids(api, 'user01') == ['user01-primary-0', 'user01-primary-1'], cached_ids(api, 'user01')
+    assert cached_ids(api, 'user02') == ['user02-primary-0'], cached_ids(api, 'user02')
+    # The 410 is followed by a one-page full sync that picks up the change too
+    assert stub.single_requests == 1, f"{stub.single_requests} requests after the 410"
+    assert cached_ids(api, 'expired') == ['expired-primary-0', 'expired-primary-1'], cached_ids(api, 'expired')
+    calendar = api.event_cache.get('expired')
+    assert calendar.calendars['primary'].sync_token == 'sync-expired-primary-full', "full sync token not stored"
+
+
+CHECKS = [
+    check_first_sync,
+    check_incremental_sync_and_expired_token,
+]
+
+
+def main():
+    stub = CalendarStub()
+    os.environ.update({
+        'GOOGLE_CALENDAR_BATCH_URI': f"{stub.url}/batch/calendar/v3",
+        'GOOGLE_CALENDAR_API_URI': f"{stub.url}/calendar/v3/",
+        'CALENDAR_PAGE_SIZE': str(PAGE_SIZE),
+        'CREDENTIAL_BACKEND': 'sqlite',
+        'CREDENTIAL_DB': os.path.join(tempfile.mkdtemp(prefix='calendar-check-'), 'credentials.db'),
+    })
+    os.chdir(ROOT)
+
+    from google.oauth2.credentials import Credentials
+    from google_calendar import GoogleCalendarAPI
+
+    api = GoogleCalendarAPI()
+    for user_id in USERS:
+        api.credential_manager.save(user_id, Credentials(
+            token=f"token-{user_id}", expiry=datetime.utcnow() + timedelta(hours=1)
+        ))
+
+    failed = 0
+    try:
+        for check in CHECKS:
+            stub.reset_counts()
+            name = check.__name__[len('check_'):]
+            try:
+                check(api, stub)
+            except Exception as e:
+                failed += 1
+                print(f"FAIL {name}: {type(e).__name__}: {e}")
+            else:
+                print(f"ok   {name}")
+    finally:
+        stub.shutdown()
+
+    print(f"{len(CHECKS) - failed}/{len(CHECKS)} checks passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""Check HighriseClient's pooling, retries, timeouts and circuit breaker against a local stub
+
+Runs the chat/completions stub from chat_load.py on a free local port and
+drives a HighriseClient at it. Each scenario queues the stub's answers
+(a status code, a stall, or a normal streamed reply), then checks how
+many requests and TCP connections the stub saw and what the client did:
+
+- consecutive chat turns reuse one keep-alive connection
+- 429 and 503 answers are retried until a reply streams
+- a 400 answer is raised at once, without retrying
+- a stalled response fails with a read timeout
+- repeated failures open the circuit, calls then fail fast without
+  reaching the stub, and a trial call after reset_timeout closes it again
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python benchmarks/check_highrise_client.py
+"""
+import collections
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.chat_load import stub_handler
+from highrise_client import CircuitBreaker, CircuitOpenError, HighriseClient, HighriseError
+
+PAYLOAD = {'model': 'stub', 'messages': [{'role': 'user', 'content': 'What should I eat for lunch?'}]}
+REPLY = 'Stub reply to: What should I eat for lunch?'
+
+
+class ScriptedStub:
+    """The chat_load.py stub, answering from a queue of planned responses
+
+    `plan()` queues answers for the next requests: an int is sent as that
+    status, ('stall', seconds) sleeps before replying normally, and None
+    replies normally. Once the queue is empty every request is answered
+    normally. Requests and newly accepted connections are counted.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self._planned = collections.deque()
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(stub_handler(latency=0, jitter=0, chunks=1, chunk_interval=0, error_rate=0, seed=0)):
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                with stub._lock:
+                    stub.requests += 1
+                    answer = stub._planned.popleft() if stub._planned else None
+                if isinstance(answer, int):
+                    self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                    self._send_json(answer, {'error': f"planned {answer}"})
+                    return
+                if answer is not None:
+                    time.sleep(answer[1])
+                super().do_POST()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True, name='stub-highrise').start()
+
+    def plan(self, *answers):
+        with self._lock:
+            self._planned.extend(answers)
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.connections = 0
+            self._planned.clear()
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+def client_for(stub, **kwargs):
+    options = {'max_retries': 3, 'backoff': 0.01, 'max_backoff': 0.05, 'read_timeout': 2}
+    options.update(kwargs)
+    return HighriseClient(stub.url, 'stub', **options)
+
+
+def chat(client):
+    return ''.join(client.stream_chat(PAYLOAD))
+
+
+def check_connection_reuse(stub):
+    client = client_for(stub)
+    replies = [chat(client) for _ in range(5)]
+    assert replies == [REPLY] * 5, replies
+    assert stub.requests == 5, f"{stub.requests} requests"
+    assert stub.connections == 1, f"5 turns opened {stub.connections} connections"
+
+
+def check_retries_429_and_503(stub):
+    stub.plan(429, 503)
+    reply = chat(client_for(stub))
+    assert reply == REPLY, reply
+    assert stub.requests == 3, f"{stub.requests} requests for 2 retryable failures"
+
+
+def check_no_retry_on_400(stub):
+    stub.plan(400)
+    client = client_for(stub)
+    try:
+        chat(client)
+    except HighriseError as e:
+        assert e.status == 400, e.status
+    else:
+        raise AssertionError("400 answer did not raise")
+    assert stub.requests == 1, f"{stub.requests} requests for a 400 answer"
+    assert not client.breaker.is_open, "a 400 answer opened the circuit"
+
+
+def check_read_timeout(stub):
+    stub.plan(('stall', 1.5))
+    client = client_for(stub, max_retries=0, read_timeout=0.3)
+    started = time.monotonic()
+    try:
+        chat(client)
+    except requests.Timeout:
+        pass
+    else:
+        raise AssertionError("stalled response did not time out")
+    elapsed = time.monotonic() - started
+    assert elapsed < 1.0, f"read timeout took {elapsed:.2f}s"
+
+
+def check_breaker_opens_and_recovers(stub):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.5)
+    client = client_for(stub, max_retries=0, breaker=breaker)
+    stub.plan(503, 503)
+    for _ in range(2):
+        try:
+            chat(client)
+        except CircuitOpenError:
+            raise AssertionError("circuit opened before the threshold")
+        except HighriseError as e:
+            assert e.status == 503, e.status
+    assert breaker.is_open, "circuit still closed after 2 failures"
+
+    try:
+        chat(client)
+    except CircuitOpenError:
+        pass
+    else:
+        raise AssertionError("open circuit let a call through")
+    assert stub.requests == 2, "open circuit reached the stub"
+
+    time.sleep(0.6)
+    assert chat(client) == REPLY
+    assert not breaker.is_open, "successful trial call left the circuit open"
+    assert stub.requests == 3, f"{stub.requests} requests"
+
+
+CHECKS = [
+    check_connection_reuse,
+    check_retries_429_and_503,
+    check_no_retry_on_400,
+    check_read_timeout,
+    check_breaker_opens_and_recovers,
+]
+
+
+def main():
+    stub = ScriptedStub()
+    failed = 0
+    try:
+        for check in CHECKS:
+            stub.reset()
+            name = check.__name__[len('check_'):]
+            try:
+                check(stub)
+            except Exception as e:
+                failed += 1
+                print(f"FAIL {name}: {type(e).__name__}: {e}")
+            else:
+                print(f"ok   {name}")
+    finally:
+        stub.shutdown()
+
+    print(f"{len(CHECKS) - failed}/{len(CHECKS)} checks passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Check MenuCache's shared loads, timeouts and stale-while-revalidate behaviour
+
+Drives a MenuCache whose loader sleeps for a set time and counts its calls,
+with waiters on the shared async runner loop the way the DoorDash routes
+and the welcome reminder use it. It checks that:
+
+- concurrent callers share one load
+- a caller that times out leaves the load running, so the other callers
+  get the value and it is cached
+- a stale value is served at once while one background refresh replaces it
+- a failed refresh keeps the stale value
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python benchmarks/check_menu_cache.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.async_runner import async_runner
+from api.menu_cache import MenuCache
+
+
+class SlowLoader:
+    """Coroutine loader that sleeps `delay` seconds, then returns or raises"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.fail = False
+
+    async def __call__(self, key):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"planned failure for {key}")
+        return f"menu for {key} #{self.calls}"
+
+
+def check_concurrent_callers_share_one_load():
+    loader = SlowLoader(0.2)
+    cache = MenuCache(loader)
+    futures = [async_runner.submit(cache.get('tacos')) for _ in range(5)]
+    values = [future.result(5) for future in futures]
+    assert values == ['menu for tacos #1'] * 5, values
+    assert loader.calls == 1, f"{loader.calls} loads for 5 callers"
+
+
+def check_timed_out_caller_keeps_shared_load():
+    loader = SlowLoader(0.5)
+    cache = MenuCache(loader)
+    patient = async_runner.submit(cache.get('ramen'))
+    try:
+        async_runner.run(cache.get('ramen'), 0.1)
+    except asyncio.TimeoutError:
+        pass
+    else:
+        raise AssertionError("caller with a short timeout did not time out")
+
+    assert patient.result(5) == 'menu for ramen #1', "other caller lost the shared load"
+    assert cache.peek('ramen') == 'menu for ramen #1', "timed out load was not cached"
+    assert loader.calls == 1, f"{loader.calls} loads"
+
+
+def check_stale_value_served_while_refreshing():
+    loader = SlowLoader(0.2)
+    cache = MenuCache(loader, ttl=0.1, max_stale=60)
+    assert async_runner.run(cache.get('pho'), 5) == 'menu for pho #1'
+    time.sleep(0.15)
+
+    started = time.monotonic()
+    assert async_runner.run(cache.get('pho'), 5) == 'menu for pho #1', "stale value not served"
+    assert time.monotonic() - started < 0.1, "stale read waited for the refresh"
+    time.sleep(0.3)
+    assert cache.peek('pho') == 'menu for pho #2', "refresh did not replace the stale value"
+    assert cache.stats()['stale_hits'] == 1, cache.stats()
+
+
+def check_failed_refresh_keeps_stale_value():
+    loader = SlowLoader(0.05)
+    cache = MenuCache(loader, ttl=0.1, max_stale=60)
+    assert async_runner.run(cache.get('sushi'), 5) == 'menu for sushi #1'
+    time.sleep(0.15)
+
+    loader.fail = True
+    future = cache.refresh('sushi')
+    try:
+        future.result(5)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("planned failure did not raise")
+    assert cache.peek('sushi') == 'menu for sushi #1', "failed refresh dropped the stale value"
+
+
+CHECKS = [
+    check_concurrent_callers_share_one_load,
+    check_timed_out_caller_keeps_shared_load,
+    check_stale_value_served_while_refreshing,
+    check_failed_refresh_keeps_stale_value,
+]
+
+
+def main():
+    failed = 0
+    try:
+        for check in CHECKS:
+            name = check.__name__[len('check_'):]
+            try:
+                check()
+            except Exception as e:
+                failed += 1
+                print(f"FAIL {name}: {type(e).__name__}: {e}")
+            else:
+                print(f"ok   {name}")
+    finally:
+        async_runner.shutdown()
+
+    print(f"{len(CHECKS) - failed}/{len(CHECKS)} checks passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+from bisect import bisect_left, bisect_right
+
+
+class BusyIndex:
+    """Merged busy intervals of one user, answering free-time queries in O(log n)
+
+    Overlapping and touching intervals are merged into disjoint blocks sorted
+    by start, so a bisect finds the blocks around any moment. The free gaps
+    between consecutive blocks get a sparse table of range maxima, which makes
+    the largest gap inside any window a constant-time lookup once the
+    window's blocks have been located.
+    """
+
+    def __init__(self, intervals):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+        # _gap_table[k][i] is the index of the largest gap among gaps i .. i + 2**k - 1,
+        # where gap i runs from the end of block i to the start of block i + 1
+        self._gaps = [self.starts[i + 1] - self.ends[i] for i in range(len(self.starts) - 1)]
+        self._gap_table = [list(range(len(self._gaps)))]
+        width = 1
+        while 2 * width <= len(self._gaps):
+            previous = self._gap_table[-1]
+            self._gap_table.append([
+                self._larger_gap(previous[i], previous[i + width])
+                for i in range(len(self._gaps) - 2 * width + 1)
+            ])
+            width *= 2
+
+    @classmethod
+    def from_events(cls, events):
+        """Index the timed events of a CalendarEvent iterable; all-day events don't block time"""
+        return cls((event.local_start, event.local_end) for event in events if not event.all_day)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _larger_gap(self, i, j):
+        return i if self._gaps[i] >= self._gaps[j] else j
+
+    def _largest_gap_between(self, first, last):
+        """Index of the largest of gaps first .. last inclusive"""
+        level = (last - first + 1).bit_length() - 1
+        table = self._gap_table[level]
+        return self._larger_gap(table[first], table[last - (1 << level) + 1])
+
+    def is_busy(self, moment):
+        i = bisect_right(self.starts, moment) - 1
+        return i >= 0 and moment < self.ends[i]
+
+    def next_busy_start(self, moment):
+        """Start of the first busy block that has not ended by `moment`, or None
+
+        The result is at or before `moment` when `moment` itself is busy.
+        """
+        i = bisect_right(self.ends, moment)
+        return self.starts[i] if i < len(self.starts) else None
+
+    def busy_between(self, window_start, window_end):
+        """Busy blocks overlapping the window, clipped to it"""
+        first = bisect_right(self.ends, window_start)
+        last = bisect_left(self.starts, window_end)
+        return [(max(self.starts[i], window_start), min(self.ends[i], window_end))
+                for i in range(first, last)]
+
+    def largest_free_gap(self, window_start, window_end):
+        """Longest free (start, end) inside the window, or None if it is fully booked
+
+        Ties go to the earliest gap.
+        """
+        if window_end <= window_start:
+            return None
+
+        first = bisect_right(self.ends, window_start)
+        last = bisect_left(self.starts, window_end)
+        if first == last:
+            return (window_start, window_end)
+
+        candidates = []
+        if self.starts[first] > window_start:
+            candidates.append((window_start, self.starts[first]))
+        if last - first > 1:
+            gap = self._largest_gap_between(first, last - 2)
+            candidates.append((self.ends[gap], self.starts[gap + 1]))
+        if self.ends[last - 1] < window_end:
+            candidates.append((self.ends[last - 1], window_end))
+
+        best = None
+        for gap in candidates:
+            if best is None or gap[1] - gap[0] > best[1] - best[0]:
+                best = gap
+        return best
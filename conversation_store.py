@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting; about four characters per token for English"""
+    return len(text) // 4 + 1
+
+
+class _Conversation:
+    __slots__ = ('messages', 'summary', 'dropped', 'last_active')
+
+    def __init__(self, max_messages, now):
+        self.messages = deque(maxlen=max_messages)
+        self.summary = None
+        self.dropped = []
+        self.last_active = now
+
+
+class ConversationStore:
+    """Bounded chat memory for every active user
+
+    Each user keeps at most `max_messages` messages. Prompts are built from
+    the newest messages that fit in `context_tokens`. If a `summarizer` is
+    given, messages pushed out of the deque are folded into a rolling summary
+    `summary_batch` at a time by calling `summarizer(summary, messages)`,
+    and the summary is sent ahead of the recent turns.
+
+    Users are kept in least-recently-active order. Anyone idle for
+    `idle_ttl` seconds, or beyond `max_users`, is evicted and `on_evict` is
+    called with their ID.
+    """
+
+    def __init__(self, max_messages=50, context_tokens=3000, idle_ttl=86400, max_users=10000,
+                 summarizer=None, summary_batch=10, on_evict=None):
+        self.max_messages = max_messages
+        self.context_tokens = context_tokens
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self.summarizer = summarizer
+        self.summary_batch = summary_batch
+        self.on_evict = on_evict
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._users)
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return user_id in self._users
+
+    def _evict(self, now):
+        """Drop idle and surplus users, returning their IDs. Caller must hold the lock."""
+        evicted = []
+        while self._users:
+            user_id, conversation = next(iter(self._users.items()))
+            if len(self._users) <= self.max_users and now - conversation.last_active < self.idle_ttl:
+                break
+            del self._users[user_id]
+            evicted.append(user_id)
+        return evicted
+
+    def _notify_evicted(self, evicted):
+        if self.on_evict:
+            for user_id in evicted:
+                try:
+                    self.on_evict(user_id)
+                except Exception as e:
+                    print(f"Error evicting conversation for {user_id}: {e}")
+
+    def touch(self, user_id):
+        """Mark a user active, starting an empty conversation if needed"""
+        self._conversation(user_id)
+
+    def _conversation(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            conversation = self._users.get(user_id)
+            if conversation is None:
+                conversation = self._users[user_id] = _Conversation(self.max_messages, now)
+            else:
+                conversation.last_active = now
+                self._users.move_to_end(user_id)
+            evicted = self._evict(now)
+        self._notify_evicted(evicted)
+        return conversation
+
+    def append(self, user_id, role, content):
+        """Add a message to a user's conversation"""
+        conversation = self._conversation(user_id)
+        with self._lock:
+            if len(conversation.messages) == conversation.messages.maxlen:
+                if self.summarizer:
+                    conversation.dropped.append(conversation.messages[0])
+            conversation.messages.append({'role': role, 'content': content})
+
+            if len(conversation.dropped) < self.summary_batch:
+                return
+            summary, dropped = conversation.summary, conversation.dropped
+            conversation.dropped = []
+
+        # Summarize outside the lock; the summarizer may call the LLM
+        try:
+            summary = self.summarizer(summary, dropped)
+        except Exception as e:
+            print(f"Error summarizing conversation for {user_id}: {e}")
+            return
+        with self._lock:
+            conversation.summary = summary
+
+    def context(self, user_id, system_prompt):
+        """Messages for the next prompt: system prompt, summary and the newest turns within budget"""
+        conversation = self._conversation(user_id)
+        with self._lock:
+            messages = list(conversation.messages)
+            summary = conversation.summary
+
+        prefix = [{'role': 'system', 'content': system_prompt}]
+        if summary:
+            prefix.append({'role': 'system', 'content': f"Summary of the earlier conversation: {summary}"})
+
+        budget = self.context_tokens - sum(estimate_tokens(message['content']) for message in prefix)
+        recent = []
+        for message in reversed(messages):
+            budget -= estimate_tokens(message['content'])
+            # Always send the newest message, even if it alone exceeds the budget
+            if budget < 0 and recent:
+                break
+            recent.append(message)
+        recent.reverse()
+        return prefix + recent
+
+    def active_users(self):
+        """IDs of users active within `idle_ttl`, least recently active first"""
+        with self._lock:
+            evicted = self._evict(time.monotonic())
+            user_ids = list(self._users)
+        self._notify_evicted(evicted)
+        return user_ids
@@ -0,0 +1,290 @@
+import functools
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+import requests
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+
+from reminder_scheduler import ReminderScheduler
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class CredentialBackend:
+    """Storage interface for CredentialManager"""
+
+    def load_all(self):
+        """Return (user_id, credentials) pairs for every stored user"""
+        raise NotImplementedError
+
+    def save(self, user_id, credentials):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        """Delete a user's credentials, returning False on failure"""
+        raise NotImplementedError
+
+    def expiring_before(self, moment):
+        """Return ids of users whose tokens expire before a naive UTC datetime"""
+        return [user_id for user_id, credentials in self.load_all()
+                if credentials.expiry is not None and credentials.expiry < moment]
+
+
+class PickleFileBackend(CredentialBackend):
+    """One pickle file per user, replaced atomically on save"""
+
+    def __init__(self, credentials_dir):
+        self.credentials_dir = credentials_dir
+
+    def _path(self, user_id):
+        return os.path.join(self.credentials_dir, f"{user_id}.pickle")
+
+    def load_all(self):
+        loaded = []
+        for name in os.listdir(self.credentials_dir):
+            if not name.endswith('.pickle'):
+                continue
+            user_id = name[:-len('.pickle')]
+            try:
+                with open(self._path(user_id), 'rb') as token:
+                    loaded.append((user_id, pickle.load(token)))
+            except Exception as e:
+                print(f"Error loading credentials for {user_id}: {e}")
+        return loaded
+
+    def save(self, user_id, credentials):
+        """Write credentials to a temp file and rename it over the old one"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.credentials_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as token:
+                pickle.dump(credentials, token)
+            os.replace(tmp_path, self._path(user_id))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def delete(self, user_id):
+        credentials_path = self._path(user_id)
+        if os.path.exists(credentials_path):
+            try:
+                os.remove(credentials_path)
+            except Exception as e:
+                print(f"Error removing credentials file: {e}")
+                return False
+        return True
+
+
+class SQLiteCredentialBackend(CredentialBackend):
+    """All users' credentials in one SQLite table keyed by user_id
+
+    Token expiry is kept in its own indexed column so refresh candidates can be
+    found with a single query. Pickle files left by PickleFileBackend are
+    imported when the database is first created.
+    """
+
+    def __init__(self, db_path, import_dir=None):
+        self.db_path = db_path
+        is_new = not os.path.exists(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS credentials (
+                    user_id TEXT PRIMARY KEY,
+                    credentials BLOB NOT NULL,
+                    expiry REAL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS credentials_expiry ON credentials (expiry)")
+
+        if is_new and import_dir:
+            for user_id, credentials in PickleFileBackend(import_dir).load_all():
+                self.save(user_id, credentials)
+
+    @staticmethod
+    def _timestamp(moment):
+        return (moment - EPOCH).total_seconds() if moment is not None else None
+
+    def load_all(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, credentials FROM credentials").fetchall()
+
+        loaded = []
+        for user_id, blob in rows:
+            try:
+                loaded.append((user_id, pickle.loads(blob)))
+            except Exception as e:
+                print(f"Error loading credentials for {user_id}: {e}")
+        return loaded
+
+    def save(self, user_id, credentials):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO credentials (user_id, credentials, expiry, updated_at)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT (user_id) DO UPDATE SET
+                       credentials = excluded.credentials,
+                       expiry = excluded.expiry,
+                       updated_at = excluded.updated_at""",
+                (
+                    user_id,
+                    pickle.dumps(credentials),
+                    self._timestamp(credentials.expiry),
+                    self._timestamp(datetime.utcnow()),
+                )
+            )
+
+    def delete(self, user_id):
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM credentials WHERE user_id = ?", (user_id,))
+        except sqlite3.Error as e:
+            print(f"Error removing credentials from database: {e}")
+            return False
+        return True
+
+    def expiring_before(self, moment):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id FROM credentials WHERE expiry < ?",
+                (self._timestamp(moment),)
+            ).fetchall()
+        return [user_id for user_id, in rows]
+
+
+def backend_from_env(credentials_dir):
+    """Create the credential backend selected by CREDENTIAL_BACKEND"""
+    backend = os.getenv('CREDENTIAL_BACKEND', 'sqlite')
+    if backend == 'pickle':
+        return PickleFileBackend(credentials_dir)
+    if backend == 'sqlite':
+        db_path = os.getenv('CREDENTIAL_DB', os.path.join(credentials_dir, 'credentials.db'))
+        return SQLiteCredentialBackend(db_path, import_dir=credentials_dir)
+    raise ValueError(f"Unknown credential backend: {backend}")
+
+
+class CredentialManager:
+    """Keeps Google OAuth credentials in memory and refreshes them before they expire
+
+    Credentials are bulk-loaded from the backend once at startup. After that,
+    lookups are dictionary reads and writes go straight to the backend. A
+    ReminderScheduler refreshes each token `refresh_margin` seconds before
+    its expiry, so request handlers never block on Google's token endpoint.
+    Failed refreshes are retried after `retry_delay` seconds, except when
+    Google rejects the grant (revoked or expired refresh token). Those
+    credentials are removed, `on_revoked` is called with the user's ID and
+    the user is asked to sign in again.
+    """
+
+    def __init__(self, backend, refresh_margin=300, retry_delay=60, on_revoked=None):
+        self.backend = backend
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self.retry_delay = timedelta(seconds=retry_delay)
+        self.on_revoked = on_revoked
+
+        self._credentials = {}
+        self._lock = threading.Lock()
+        # google-auth stores expiry as naive UTC, so refreshes are scheduled against a UTC clock
+        self._scheduler = ReminderScheduler(clock=datetime.utcnow, name='credential-refresh')
+        self._session = requests.Session()
+
+        self._load_all()
+
+    def _load_all(self):
+        """Load every stored credential into memory"""
+        loaded = self.backend.load_all()
+        # Tokens that are already due are refreshed first, the rest by expiry
+        due = set(self.backend.expiring_before(datetime.utcnow() + self.refresh_margin))
+
+        with self._lock:
+            for user_id, credentials in loaded:
+                self._credentials[user_id] = credentials
+                self._schedule(user_id, credentials,
+                               refresh_at=datetime.utcnow() if user_id in due else None)
+
+    def _schedule(self, user_id, credentials, refresh_at=None):
+        """Queue the next refresh for a user, replacing any queued one. Caller must hold the lock."""
+        if not credentials.refresh_token or refresh_at is None and credentials.expiry is None:
+            self._scheduler.cancel(user_id)
+            return
+        if refresh_at is None:
+            refresh_at = credentials.expiry - self.refresh_margin
+
+        self._scheduler.schedule(user_id, user_id, refresh_at, functools.partial(self._refresh, user_id, credentials))
+
+    def get(self, user_id):
+        """Return the user's credentials without blocking
+
+        Expired credentials are still returned but queued for an immediate
+        refresh; callers should check `credentials.valid`.
+        """
+        with self._lock:
+            credentials = self._credentials.get(user_id)
+            if credentials is not None and credentials.expired and credentials.refresh_token:
+                self._schedule(user_id, credentials, refresh_at=datetime.utcnow())
+            return credentials
+
+    def has(self, user_id):
+        with self._lock:
+            return user_id in self._credentials
+
+    def save(self, user_id, credentials):
+        """Store new credentials for a user"""
+        self.backend.save(user_id, credentials)
+        with self._lock:
+            self._credentials[user_id] = credentials
+            self._schedule(user_id, credentials)
+
+    def remove(self, user_id):
+        """Forget a user's credentials, returning False if they could not be deleted"""
+        with self._lock:
+            self._credentials.pop(user_id, None)
+            self._scheduler.cancel(user_id)
+
+        return self.backend.delete(user_id)
+
+    def _refresh(self, user_id, credentials):
+        retry_at = None
+        revoked = False
+        try:
+            credentials.refresh(Request(session=self._session))
+        except RefreshError as e:
+            print(f"Error refreshing credentials for {user_id}: {e}")
+            if getattr(e, 'retryable', False):
+                retry_at = datetime.utcnow() + self.retry_delay
+            else:
+                revoked = True
+        except Exception as e:
+            print(f"Error refreshing credentials for {user_id}: {e}")
+            retry_at = datetime.utcnow() + self.retry_delay
+
+        with self._lock:
+            if self._credentials.get(user_id) is not credentials:
+                return  # Logged out or replaced while refreshing
+            if not revoked:
+                self._schedule(user_id, credentials, refresh_at=retry_at)
+
+        if revoked:
+            # Retrying a rejected grant can never succeed; the user has to sign in again
+            print(f"Removing revoked credentials for {user_id}")
+            self.remove(user_id)
+            if self.on_revoked:
+                try:
+                    self.on_revoked(user_id)
+                except Exception as e:
+                    print(f"Error cleaning up after revoked credentials for {user_id}: {e}")
+            return
+
+        if retry_at is None:
+            try:
+                self.backend.save(user_id, credentials)
+            except Exception as e:
+                print(f"Error saving refreshed credentials for {user_id}: {e}")
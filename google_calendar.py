@@ -1,23 +1,359 @@
+import functools
+import heapq
 import os
-import pickle
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+import google_auth_httplib2
+import httplib2
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from datetime import datetime, timedelta
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
+from datetime import datetime, timedelta, time as dt_time
 from dotenv import load_dotenv
 
+from busy_index import BusyIndex
+from credential_store import CredentialManager, backend_from_env
+from rfc3339 import parse_date, parse_datetime
+
 load_dotenv()
 
+# Google's limit on requests per batch HTTP request
+BATCH_LIMIT = 50
+
+# Only the event fields ExecuMate reads; cancelled events in sync deltas carry just id and status
+EVENT_FIELDS = 'nextPageToken,nextSyncToken,items(id,iCalUID,status,summary,location,start,end)'
+
+
+class CredentialsUnavailableError(Exception):
+    """The user has no valid Google credentials right now, e.g. while a token refresh is pending"""
+
+
+# Meal windows in local time of day
+LUNCH_START = dt_time(11, 0)   # 11:00 AM
+LUNCH_END = dt_time(14, 0)     # 2:00 PM
+DINNER_START = dt_time(17, 0)  # 5:00 PM
+DINNER_END = dt_time(20, 0)    # 8:00 PM
+MEAL_WINDOWS = {'lunch': (LUNCH_START, LUNCH_END), 'dinner': (DINNER_START, DINNER_END)}
+
+
+def _aware(moment):
+    """Treat timestamps without an offset as local time"""
+    return moment if moment.tzinfo is not None else moment.astimezone()
+
+
+class CalendarEvent:
+    """A calendar event normalized once when it is fetched
+
+    `start` and `end` are timezone-aware and keep the event's own offset.
+    `local_start` and `local_end` are the same instants as naive local times,
+    for comparing with `datetime.now()`. All-day events have no `start` or
+    `end` and span whole local days.
+    """
+
+    __slots__ = ('id', 'ical_uid', 'summary', 'location', 'start', 'end',
+                 'local_start', 'local_end', 'all_day', 'date_key')
+
+    def __init__(self, id, ical_uid, summary, location, start, end, local_start, local_end, all_day):
+        self.id = id
+        self.ical_uid = ical_uid
+        self.summary = summary
+        self.location = location
+        self.start = start
+        self.end = end
+        self.local_start = local_start
+        self.local_end = local_end
+        self.all_day = all_day
+        self.date_key = (start or local_start).strftime('%Y-%m-%d')
+
+    @classmethod
+    def from_api(cls, item):
+        """Build an event from an events().list item, or None if it has no start"""
+        start_value = item.get('start', {})
+        end_value = item.get('end', {})
+
+        if 'dateTime' in start_value:
+            start = _aware(parse_datetime(start_value['dateTime']))
+            end = _aware(parse_datetime(end_value['dateTime'])) if 'dateTime' in end_value else None
+            local_start = start.astimezone().replace(tzinfo=None)
+            local_end = end.astimezone().replace(tzinfo=None) if end else local_start
+            all_day = False
+        elif 'date' in start_value:
+            start = end = None
+            local_start = datetime.combine(parse_date(start_value['date']), datetime.min.time())
+            local_end = (datetime.combine(parse_date(end_value['date']), datetime.min.time())
+                         if 'date' in end_value else local_start + timedelta(days=1))
+            all_day = True
+        else:
+            return None
+
+        return cls(
+            item.get('id'),
+            item.get('iCalUID'),
+            item.get('summary'),
+            item.get('location', ''),
+            start,
+            end,
+            local_start,
+            local_end,
+            all_day,
+        )
+
+    def to_dict(self):
+        """Google-style event dict for reminder payloads"""
+        event = {'id': self.id, 'location': self.location}
+        if self.summary is not None:
+            event['summary'] = self.summary
+        if self.all_day:
+            event['start'] = {'date': self.local_start.date().isoformat()}
+            event['end'] = {'date': self.local_end.date().isoformat()}
+        else:
+            event['start'] = {'dateTime': self.start.isoformat()}
+            if self.end:
+                event['end'] = {'dateTime': self.end.isoformat()}
+        return event
+
+
+def merge_events(streams):
+    """k-way merge of event streams that are each ordered by start time
+
+    The same meeting often appears on several of a user's calendars (their
+    own, a delegate's, a shared team calendar) under one iCalUID. Only the
+    first copy is kept. The key includes the start time because instances of a
+    recurring event share their iCalUID. Since the merged stream is ordered,
+    only keys at the current start time need remembering.
+    """
+    seen = set()
+    current_start = None
+    for event in heapq.merge(*streams, key=lambda event: event.local_start):
+        if event.local_start != current_start:
+            current_start = event.local_start
+            seen.clear()
+        key = event.ical_uid or event.id
+        if key in seen:
+            continue
+        seen.add(key)
+        yield event
+
+
+class _CalendarCopy:
+    """Synced events of one Google calendar"""
+
+    def __init__(self, calendar_id):
+        self.calendar_id = calendar_id
+        self.events = {}
+        self.sync_token = None
+        self.window_start = None
+        self._ordered = None
+
+    def reset(self):
+        self.events = {}
+        self.sync_token = None
+        self.window_start = None
+        self._ordered = None
+
+    def apply(self, items):
+        """Apply a page of events, dropping cancelled ones"""
+        for item in items:
+            event_id = item.get('id')
+            if not event_id:
+                continue
+            event = None if item.get('status') == 'cancelled' else CalendarEvent.from_api(item)
+            if event is None:
+                self.events.pop(event_id, None)
+            else:
+                self.events[event_id] = event
+        self._ordered = None
+
+    def events_between(self, start_date, end_date):
+        """Events overlapping [start_date, end_date], ordered by start time"""
+        if self._ordered is None:
+            ordered = sorted(self.events.values(), key=lambda event: event.local_start)
+            self._ordered = (
+                [event.local_start for event in ordered],
+                ordered,
+                # Longest event duration bounds how far back an overlapping event can start
+                max((event.local_end - event.local_start for event in ordered), default=timedelta(0)),
+            )
+
+        starts, ordered, longest = self._ordered
+        lo = bisect_left(starts, start_date - longest)
+        hi = bisect_right(starts, end_date)
+        return [event for event in ordered[lo:hi]
+                if event.local_end > start_date or event.local_start >= start_date]
+
+
+class _UserCalendar:
+    """Local copy of every calendar a user has selected in Google Calendar"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calendars = {}  # calendar_id -> _CalendarCopy
+        self.calendars_listed_at = None
+        self.synced_at = None
+        self.version = 0
+        self._busy = None  # (version, BusyIndex)
+
+    def set_calendar_ids(self, calendar_ids):
+        """Track exactly these calendars, keeping the synced copies of known ones"""
+        if set(calendar_ids) != set(self.calendars):
+            self.version += 1
+            self.calendars = {
+                calendar_id: self.calendars.get(calendar_id) or _CalendarCopy(calendar_id)
+                for calendar_id in calendar_ids
+            }
+
+    def reset(self, calendar_id):
+        self.version += 1
+        self.calendars[calendar_id].reset()
+
+    def apply(self, calendar_id, items):
+        if items:
+            self.version += 1
+        self.calendars[calendar_id].apply(items)
+
+    def covers(self, start_date):
+        return bool(self.calendars) and all(
+            copy.sync_token is not None and copy.window_start <= start_date
+            for copy in self.calendars.values()
+        )
+
+    def events_between(self, start_date, end_date):
+        """Events from all calendars overlapping [start_date, end_date], ordered by start time"""
+        return list(merge_events(
+            copy.events_between(start_date, end_date) for copy in self.calendars.values()
+        ))
+
+    def busy_index(self):
+        """BusyIndex over every cached event, rebuilt only after the events change"""
+        if self._busy is None or self._busy[0] != self.version:
+            self._busy = (self.version, BusyIndex.from_events(
+                event for copy in self.calendars.values() for event in copy.events.values()
+            ))
+        return self._busy[1]
+
+
+class CalendarEventCache:
+    """Per-user event cache kept current with Google Calendar sync tokens
+
+    The first sync of each calendar downloads everything from `lookback_days`
+    before today onwards and stores the returned `nextSyncToken`. Later syncs
+    only fetch the changes since that token. Syncs closer together than
+    `min_sync_interval` seconds are served from memory without an API call,
+    and the list of calendars a user has selected is re-read every
+    `calendar_list_interval` seconds.
+    """
+
+    def __init__(self, min_sync_interval=60, lookback_days=7, calendar_list_interval=3600):
+        self.min_sync_interval = min_sync_interval
+        self.lookback_days = lookback_days
+        self.calendar_list_interval = calendar_list_interval
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            calendar = self._users.get(user_id)
+            if calendar is None:
+                calendar = self._users[user_id] = _UserCalendar()
+            return calendar
+
+    def drop(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def is_fresh(self, calendar):
+        return (calendar.synced_at is not None
+                and time.monotonic() - calendar.synced_at < self.min_sync_interval)
+
+    def calendars_due(self, calendar):
+        return (calendar.calendars_listed_at is None
+                or time.monotonic() - calendar.calendars_listed_at >= self.calendar_list_interval)
+
+
+class _PooledService:
+    def __init__(self, service, http):
+        self.service = service
+        self.http = http
+        self.lock = threading.Lock()
+
+
+class CalendarServicePool:
+    """Thread-safe cache of Calendar service objects, one per user
+
+    Each service is built once from the discovery document bundled with
+    google-api-python-client and keeps its HTTP connection open between calls.
+    httplib2 connections are not thread-safe, so a user's service is only
+    used while holding its lease.
+    """
+
+    def __init__(self, timeout=30, api_endpoint=None):
+        self.timeout = timeout
+        self.api_endpoint = api_endpoint
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def _build(self, credentials):
+        http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=self.timeout))
+        client_options = {'api_endpoint': self.api_endpoint} if self.api_endpoint else None
+        service = build('calendar', 'v3', http=http, static_discovery=True, cache_discovery=False,
+                        client_options=client_options)
+        return _PooledService(service, http)
+
+    @contextmanager
+    def lease(self, user_id, credentials):
+        """Yield the user's service for exclusive use, swapping in new credentials"""
+        with self._lock:
+            pooled = self._services.get(user_id)
+            if pooled is None:
+                pooled = self._services[user_id] = self._build(credentials)
+
+        with pooled.lock:
+            if pooled.http.credentials is not credentials:
+                pooled.http.credentials = credentials
+            yield pooled.service
+
+    def discard(self, user_id):
+        """Drop a user's service and close its connections"""
+        with self._lock:
+            pooled = self._services.pop(user_id, None)
+        if pooled is not None:
+            with pooled.lock:
+                pooled.http.close()
+
+
 class GoogleCalendarAPI:
     def __init__(self):
         self.client_secret_file = os.getenv('GOOGLE_CLIENT_SECRET_FILE', 'credentials/client_secret.json')
         self.scopes = ['https://www.googleapis.com/auth/calendar.readonly']
         self.redirect_uri = os.getenv('GOOGLE_REDIRECT_URI', 'http://localhost:5000/api/callback/google')
         self.credentials_dir = 'credentials'
+        self.event_cache = CalendarEventCache(
+            min_sync_interval=int(os.getenv('CALENDAR_SYNC_INTERVAL', '60')),
+            calendar_list_interval=int(os.getenv('CALENDAR_LIST_INTERVAL', '3600'))
+        )
+        self.service_pool = CalendarServicePool(
+            timeout=int(os.getenv('CALENDAR_HTTP_TIMEOUT', '30')),
+            api_endpoint=os.getenv('GOOGLE_CALENDAR_API_URI') or None
+        )
+        self.page_size = int(os.getenv('CALENDAR_PAGE_SIZE', '250'))
+        self.event_fields = os.getenv('CALENDAR_EVENT_FIELDS', EVENT_FIELDS)
+        self._change_listeners = []
+        # Batch requests go to the API's batch endpoint unless pointed at a stub server
+        self.batch_uri = os.getenv('GOOGLE_CALENDAR_BATCH_URI', 'https://www.googleapis.com/batch/calendar/v3')
+        self._batch_local = threading.local()
         
         # Create credentials directory if it doesn't exist
         if not os.path.exists(self.credentials_dir):
             os.makedirs(self.credentials_dir)
+
+        self.credential_manager = CredentialManager(
+            backend_from_env(self.credentials_dir),
+            refresh_margin=int(os.getenv('CREDENTIAL_REFRESH_MARGIN', '300')),
+            on_revoked=self._forget_user_data
+        )
         
         # Verify client secret file exists
         self.client_secret_exists = os.path.exists(self.client_secret_file)
@@ -65,80 +401,373 @@ class GoogleCalendarAPI:
         self._save_credentials(credentials, user_id)
     
     def _save_credentials(self, credentials, user_id):
-        """Save credentials to a file"""
-        credentials_path = os.path.join(self.credentials_dir, f"{user_id}.pickle")
-        with open(credentials_path, 'wb') as token:
-            pickle.dump(credentials, token)
+        """Save credentials for a user"""
+        self.credential_manager.save(user_id, credentials)
     
     def _get_credentials(self, user_id):
         """Get stored credentials for user"""
-        credentials_path = os.path.join(self.credentials_dir, f"{user_id}.pickle")
-        
-        credentials = None
-        if os.path.exists(credentials_path):
-            with open(credentials_path, 'rb') as token:
-                credentials = pickle.load(token)
-        
-        # Check if credentials are expired
-        if credentials and credentials.expired and credentials.refresh_token:
-            credentials.refresh(Request())
-            self._save_credentials(credentials, user_id)
-        
-        return credentials
+        return self.credential_manager.get(user_id)
     
     def has_credentials(self, user_id):
         """Check if we have valid credentials for this user"""
-        credentials = self._get_credentials(user_id)
-        return credentials is not None
+        return self.credential_manager.has(user_id)
     
     def clear_credentials(self, user_id):
         """Clear stored credentials for a user"""
-        credentials_path = os.path.join(self.credentials_dir, f"{user_id}.pickle")
-        
-        if os.path.exists(credentials_path):
-            try:
-                os.remove(credentials_path)
-                return True
-            except Exception as e:
-                print(f"Error removing credentials file: {e}")
-                return False
-        return True  # No credentials to remove, so success
+        self._forget_user_data(user_id)
+        return self.credential_manager.remove(user_id)
     
-    def get_service(self, user_id):
-        """Get a Google Calendar service instance"""
+    def _forget_user_data(self, user_id):
+        """Drop a user's cached events and pooled Calendar service"""
+        self.event_cache.drop(user_id)
+        self.service_pool.discard(user_id)
+    
+    @contextmanager
+    def lease_service(self, user_id):
+        """Lease the pooled Google Calendar service for a user
+
+        Yields None when the user has no valid credentials.
+        """
         credentials = self._get_credentials(user_id)
-        
+
         if not credentials or not credentials.valid:
-            return None
-        
-        return build('calendar', 'v3', credentials=credentials)
+            yield None
+            return
+
+        with self.service_pool.lease(user_id, credentials) as service:
+            yield service
     
-    def get_todays_events(self, user_id):
-        """Get today's events for a user"""
-        service = self.get_service(user_id)
+    def _event_pages(self, service, calendar_id, page_token=None, **params):
+        """Yield events().list response pages, following nextPageToken"""
+        while True:
+            events_result = self._events_request(service, calendar_id, pageToken=page_token, **params).execute()
+            yield events_result
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                return
+
+    def _events_request(self, service, calendar_id, **params):
+        return service.events().list(
+            calendarId=calendar_id,
+            maxResults=self.page_size,
+            fields=self.event_fields,
+            **params
+        )
+
+    def add_change_listener(self, listener):
+        """Call `listener(user_id)` whenever a sync changes a user's cached events"""
+        self._change_listeners.append(listener)
+
+    def _notify_if_changed(self, user_id, calendar, version):
+        # Listeners run outside the calendar lock so they can read the cache
+        if calendar.version != version:
+            for listener in self._change_listeners:
+                try:
+                    listener(user_id)
+                except Exception as e:
+                    print(f"Error in calendar change listener: {e}")
+
+    def _sync_params(self, copy):
+        """Return (events().list params, window start) for a calendar's next sync
+
+        The window start is None for incremental syncs.
+        """
+        if copy.sync_token:
+            return {'syncToken': copy.sync_token, 'singleEvents': True}, None
+
+        # Google rejects timeMin alongside syncToken, so the cached window is
+        # fixed by the full sync and later deltas cover everything after it
+        now = datetime.now()
+        window_start = datetime(now.year, now.month, now.day) - timedelta(days=self.event_cache.lookback_days)
+        return {'timeMin': window_start.isoformat() + 'Z', 'singleEvents': True}, window_start
+
+    def _finish_sync(self, copy, sync_token, window_start):
+        copy.sync_token = sync_token
+        if window_start is not None:
+            copy.window_start = window_start
+
+    def _sync_pages(self, user_id, service, calendar, copy, page_token=None, params=None, window_start=None):
+        """Sync one calendar page by page, falling back to a full sync on an expired token
+
+        Passing `page_token` and `params` continues a sync whose earlier pages
+        were already applied. Caller must hold the user's calendar lock.
+        """
+        if params is None:
+            params, window_start = self._sync_params(copy)
+            if window_start is not None:
+                calendar.reset(copy.calendar_id)
+
+        sync_token = None
+        try:
+            for events_result in self._event_pages(service, copy.calendar_id, page_token, **params):
+                calendar.apply(copy.calendar_id, events_result.get('items', []))
+                sync_token = events_result.get('nextSyncToken')
+        except HttpError as e:
+            # 410 Gone means the token expired and a full sync is required
+            if e.resp.status != 410 or 'syncToken' not in params:
+                raise
+            print(f"Sync token expired for {user_id}, doing a full sync")
+            calendar.reset(copy.calendar_id)
+            return self._sync_pages(user_id, service, calendar, copy)
+
+        self._finish_sync(copy, sync_token, window_start)
+
+    def _batch_http(self):
+        """Per-thread connection for batch requests; each part brings its own credentials"""
+        http = getattr(self._batch_local, 'http', None)
+        if http is None:
+            http = self._batch_local.http = httplib2.Http(timeout=self.service_pool.timeout)
+        return http
+
+    def _execute_batch(self, requests):
+        """Send (request, callback) pairs as batch HTTP requests of up to BATCH_LIMIT parts
+
+        If a whole batch fails, each of its callbacks receives the exception.
+        """
+        for i in range(0, len(requests), BATCH_LIMIT):
+            chunk = requests[i:i + BATCH_LIMIT]
+            batch = BatchHttpRequest(batch_uri=self.batch_uri)
+            for n, (request, callback) in enumerate(chunk):
+                batch.add(request, callback=callback, request_id=str(n))
+            try:
+                batch.execute(http=self._batch_http())
+            except Exception as e:
+                for _, callback in chunk:
+                    callback(None, None, e)
+
+    def _sync_locked(self, entries):
+        """Sync the calendars of several users whose calendar locks are held
+
+        Calendar lists that are due and the first page of every calendar's sync
+        each go out as batch requests, so a user's calendars are fetched
+        concurrently. Remaining pages and expired-token resyncs follow one
+        calendar at a time.
+
+        Args:
+            entries: (user_id, calendar) pairs
+
+        Returns:
+            Dict mapping user IDs to the exception their sync raised
+        """
+        errors = {}
+
+        def on_calendar_list(user_id, calendar, request_id, response, exception):
+            if exception is not None:
+                errors[user_id] = exception
+                return
+            calendar.set_calendar_ids([
+                item['id'] for item in response.get('items', [])
+                if item.get('primary') or item.get('selected')
+            ])
+            calendar.calendars_listed_at = time.monotonic()
+
+        def unavailable(user_id):
+            # Counted as a failed sync, so the calendar is not marked synced without being fetched
+            errors.setdefault(user_id, CredentialsUnavailableError(f"No valid credentials for {user_id}"))
+
+        requests = []
+        for user_id, calendar in entries:
+            if not self.event_cache.calendars_due(calendar):
+                continue
+            with self.lease_service(user_id) as service:
+                if not service:
+                    unavailable(user_id)
+                else:
+                    request = service.calendarList().list(
+                        minAccessRole='reader',
+                        maxResults=250,
+                        fields='items(id,primary,selected)'
+                    )
+                    requests.append((request, functools.partial(on_calendar_list, user_id, calendar)))
+        self._execute_batch(requests)
+
+        follow_ups = []  # (user_id, calendar, copy, page_token, params, window_start)
+
+        def on_first_page(user_id, calendar, copy, params, window_start, request_id, response, exception):
+            if exception is not None:
+                if isinstance(exception, HttpError) and exception.resp.status == 410 and 'syncToken' in params:
+                    print(f"Sync token expired for {user_id}, doing a full sync")
+                    calendar.reset(copy.calendar_id)
+                    follow_ups.append((user_id, calendar, copy, None, None, None))
+                else:
+                    errors[user_id] = exception
+                return
+
+            if window_start is not None:
+                calendar.reset(copy.calendar_id)
+            calendar.apply(copy.calendar_id, response.get('items', []))
+            if response.get('nextPageToken'):
+                follow_ups.append((user_id, calendar, copy, response['nextPageToken'], params, window_start))
+            else:
+                self._finish_sync(copy, response.get('nextSyncToken'), window_start)
+
+        requests = []
+        for user_id, calendar in entries:
+            if not calendar.calendars:
+                # Listing failed before we ever knew the user's calendars
+                calendar.set_calendar_ids(['primary'])
+            with self.lease_service(user_id) as service:
+                if not service:
+                    unavailable(user_id)
+                    continue
+                for copy in calendar.calendars.values():
+                    params, window_start = self._sync_params(copy)
+                    request = self._events_request(service, copy.calendar_id, **params)
+                    requests.append((request, functools.partial(
+                        on_first_page, user_id, calendar, copy, params, window_start
+                    )))
+        self._execute_batch(requests)
+
+        for user_id, calendar, copy, page_token, params, window_start in follow_ups:
+            try:
+                with self.lease_service(user_id) as service:
+                    if not service:
+                        raise CredentialsUnavailableError(f"No valid credentials for {user_id}")
+                    self._sync_pages(user_id, service, calendar, copy, page_token, params, window_start)
+            except Exception as e:
+                errors[user_id] = e
+
+        for user_id, calendar in entries:
+            if user_id not in errors:
+                calendar.synced_at = time.monotonic()
+        return errors
+
+    def sync_events(self, user_id, force=False):
+        """Bring the cached copy of a user's calendars up to date
+
+        Args:
+            user_id: User ID
+            force: Sync even if the cache was refreshed recently
+
+        Returns:
+            The user's cached calendar
+
+        Raises:
+            Exception: The sync failed; the cache keeps its last synced contents
+        """
+        calendar = self.event_cache.get(user_id)
+        version = calendar.version
+
+        try:
+            with calendar.lock:
+                if not force and self.event_cache.is_fresh(calendar):
+                    return calendar
+                errors = self._sync_locked([(user_id, calendar)])
+
+            if user_id in errors:
+                raise errors[user_id]
+            return calendar
+        finally:
+            self._notify_if_changed(user_id, calendar, version)
+
+    def sync_many(self, user_ids, force=False):
+        """Sync several users' cached calendars using batched API requests
+
+        Users already being synced by another thread are skipped.
+
+        Args:
+            user_ids: User IDs to sync
+            force: Sync even if a cache was refreshed recently
+
+        Returns:
+            Dict mapping user IDs to the exception their sync raised
+        """
+        entries = []
+        try:
+            for user_id in user_ids:
+                calendar = self.event_cache.get(user_id)
+                if not calendar.lock.acquire(blocking=False):
+                    continue
+                if not force and self.event_cache.is_fresh(calendar):
+                    calendar.lock.release()
+                    continue
+                entries.append((user_id, calendar, calendar.version))
+
+            return self._sync_locked([(user_id, calendar) for user_id, calendar, _ in entries])
+        finally:
+            for _, calendar, _ in entries:
+                calendar.lock.release()
+            for user_id, calendar, version in entries:
+                self._notify_if_changed(user_id, calendar, version)
+
+    def _stream_calendar(self, user_id, calendar_id, params):
+        """Stream one calendar's events from the API, holding the service only per page"""
+        page_token = None
+        while True:
+            with self.lease_service(user_id) as service:
+                if not service:
+                    return
+                events_result = next(self._event_pages(service, calendar_id, page_token, **params))
+
+            for item in events_result.get('items', []):
+                event = CalendarEvent.from_api(item)
+                if event is not None:
+                    yield event
+
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                return
+
+    def iter_events(self, user_id, start_date, end_date):
+        """Iterate over events in a date range from all of a user's calendars
+
+        Ranges covered by the synced cache are served from memory. Anything
+        older is streamed from the Calendar API one page at a time per
+        calendar. Either way the calendars are k-way merged into one stream
+        ordered by start time, with duplicate copies of a meeting dropped.
+
+        Args:
+            user_id: User ID
+            start_date: Start date as datetime object
+            end_date: End date as datetime object
+
+        Yields:
+            CalendarEvent objects in the date range
+        """
+        # Ensure we have datetime objects with zero time if dates were provided
+        if not isinstance(start_date, datetime) or start_date.hour == 0 and start_date.minute == 0 and start_date.second == 0:
+            start_date = datetime.combine(start_date.date(), datetime.min.time())
         
-        if not service:
-            return []
+        if not isinstance(end_date, datetime) or end_date.hour == 0 and end_date.minute == 0 and end_date.second == 0:
+            end_date = datetime.combine(end_date.date(), datetime.max.time())
         
+        # Answer from the synced copy whenever it covers the requested range,
+        # even if this sync failed and the copy is a little out of date
+        try:
+            calendar = self.sync_events(user_id)
+        except Exception as e:
+            calendar = self.event_cache.get(user_id)
+            with calendar.lock:
+                if not calendar.covers(start_date):
+                    raise
+            print(f"Error syncing calendar for {user_id}, serving cached events: {e}")
+        with calendar.lock:
+            cached = calendar.events_between(start_date, end_date) if calendar.covers(start_date) else None
+            calendar_ids = list(calendar.calendars) or ['primary']
+        if cached is not None:
+            yield from cached
+            return
+
+        # Format dates for API
+        params = {
+            'timeMin': start_date.isoformat() + 'Z',
+            'timeMax': end_date.isoformat() + 'Z',
+            'singleEvents': True,
+            'orderBy': 'startTime',
+        }
+
+        yield from merge_events(
+            self._stream_calendar(user_id, calendar_id, params) for calendar_id in calendar_ids
+        )
+
+    def get_todays_events(self, user_id):
+        """Get today's events for a user"""
         # Calculate time bounds for today using local time instead of UTC
         now = datetime.now()  # Use local time
         start_of_day = datetime(now.year, now.month, now.day, 0, 0, 0)
         end_of_day = datetime(now.year, now.month, now.day, 23, 59, 59)
-        
-        # Convert to UTC for the API but maintain the same calendar day
-        start_of_day_str = start_of_day.isoformat() + 'Z'
-        end_of_day_str = end_of_day.isoformat() + 'Z'
-        
-        # Call the Calendar API
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=start_of_day_str,
-            timeMax=end_of_day_str,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        
-        return events_result.get('items', [])
+
+        return self.get_events_for_range(user_id, start_of_day, end_of_day)
 
     def get_events_for_range(self, user_id, start_date, end_date):
         """Get events for a specified date range
@@ -149,34 +778,9 @@ class GoogleCalendarAPI:
             end_date: End date as datetime object
         
         Returns:
-            List of events in the date range
+            List of CalendarEvent objects in the date range
         """
-        service = self.get_service(user_id)
-        
-        if not service:
-            return []
-        
-        # Ensure we have datetime objects with zero time if dates were provided
-        if not isinstance(start_date, datetime) or start_date.hour == 0 and start_date.minute == 0 and start_date.second == 0:
-            start_date = datetime.combine(start_date.date(), datetime.min.time())
-        
-        if not isinstance(end_date, datetime) or end_date.hour == 0 and end_date.minute == 0 and end_date.second == 0:
-            end_date = datetime.combine(end_date.date(), datetime.max.time())
-        
-        # Format dates for API
-        start_date_str = start_date.isoformat() + 'Z'
-        end_date_str = end_date.isoformat() + 'Z'
-        
-        # Call the Calendar API
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=start_date_str,
-            timeMax=end_date_str,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        
-        return events_result.get('items', [])
+        return list(self.iter_events(user_id, start_date, end_date))
 
     def get_upcoming_events(self, user_id, days=7):
         """Get upcoming events for the next specified number of days
@@ -186,7 +790,7 @@ class GoogleCalendarAPI:
             days: Number of days to look ahead (default: 7)
         
         Returns:
-            List of events in the date range
+            List of CalendarEvent objects in the date range
         """
         # Calculate time bounds using local time
         now = datetime.now()
@@ -194,3 +798,59 @@ class GoogleCalendarAPI:
         end_date = start_of_today + timedelta(days=days, hours=23, minutes=59, seconds=59)
         
         return self.get_events_for_range(user_id, now, end_date)
+
+    def get_busy_index(self, user_id):
+        """BusyIndex over all of a user's synced calendars, built once per change
+
+        Args:
+            user_id: User ID
+
+        Returns:
+            BusyIndex of naive local (start, end) blocks, or None if the
+            calendar has never synced successfully
+        """
+        try:
+            calendar = self.sync_events(user_id)
+        except Exception as e:
+            calendar = self.event_cache.get(user_id)
+            print(f"Error syncing calendar for {user_id}, using cached events: {e}")
+        with calendar.lock:
+            if calendar.synced_at is None:
+                return None
+            return calendar.busy_index()
+
+    def query_free_busy(self, user_id, start_date, end_date):
+        """Build a BusyIndex from the FreeBusy API instead of the event cache
+
+        FreeBusy leaves out events the user marked as free and needs no prior
+        sync, at the cost of one API call per query.
+
+        Args:
+            user_id: User ID
+            start_date: Start of the range as a naive local datetime
+            end_date: End of the range as a naive local datetime
+
+        Returns:
+            BusyIndex, or None if the user has no credentials
+        """
+        calendar = self.event_cache.get(user_id)
+        with calendar.lock:
+            calendar_ids = list(calendar.calendars) or ['primary']
+
+        with self.lease_service(user_id) as service:
+            if not service:
+                return None
+            result = service.freebusy().query(body={
+                'timeMin': _aware(start_date).isoformat(),
+                'timeMax': _aware(end_date).isoformat(),
+                'items': [{'id': calendar_id} for calendar_id in calendar_ids],
+            }).execute()
+
+        intervals = []
+        for busy_calendar in result.get('calendars', {}).values():
+            for busy in busy_calendar.get('busy', []):
+                intervals.append((
+                    _aware(parse_datetime(busy['start'])).astimezone().replace(tzinfo=None),
+                    _aware(parse_datetime(busy['end'])).astimezone().replace(tzinfo=None),
+                ))
+        return BusyIndex(intervals)
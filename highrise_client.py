@@ -0,0 +1,250 @@
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Upstream statuses worth retrying; anything else is the request's own fault
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HighriseError(Exception):
+    """The Highrise API answered with an error status"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(HighriseError):
+    """Calls are being refused because the Highrise API has been failing"""
+
+
+class ThinkTagFilter:
+    """Removes <think>...</think> sections from streamed model output
+
+    Reasoning models such as DeepSeek-R1 think out loud before answering.
+    Text is fed in arbitrary chunks, so a tag may be split across chunks; the
+    filter holds back only the few characters that could still turn out to be
+    the start of a tag. Whitespace before the first visible text is dropped.
+    """
+
+    OPEN = '<think>'
+    CLOSE = '</think>'
+
+    def __init__(self):
+        self._buffer = ''
+        self._thinking = False
+        self._started = False
+
+    @staticmethod
+    def _partial_tag_length(text, tag):
+        """Length of the longest suffix of `text` that is a proper prefix of `tag`"""
+        for length in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:length]):
+                return length
+        return 0
+
+    def _visible(self, text):
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def feed(self, text):
+        """Return the visible part of `text` that can be emitted now"""
+        self._buffer += text
+        visible = []
+        while True:
+            tag = self.CLOSE if self._thinking else self.OPEN
+            index = self._buffer.find(tag)
+            if index < 0:
+                break
+            if not self._thinking:
+                visible.append(self._visible(self._buffer[:index]))
+            self._buffer = self._buffer[index + len(tag):]
+            self._thinking = not self._thinking
+
+        held = self._partial_tag_length(self._buffer, self.CLOSE if self._thinking else self.OPEN)
+        if not self._thinking:
+            visible.append(self._visible(self._buffer[:len(self._buffer) - held]))
+        self._buffer = self._buffer[len(self._buffer) - held:]
+        return ''.join(visible)
+
+    def flush(self):
+        """Return whatever visible text is still held back at the end of the stream"""
+        rest = '' if self._thinking else self._visible(self._buffer)
+        self._buffer = ''
+        return rest
+
+
+def _content(event, key):
+    """Pull choices[0][key]['content'] out of a response, which Highrise may wrap in 'data'"""
+    data = event.get('data', event)
+    choices = data.get('choices') or [{}]
+    return (choices[0].get(key) or {}).get('content') or ''
+
+
+class CircuitBreaker:
+    """Fails calls fast while an upstream keeps failing
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are refused for `reset_timeout` seconds. Then one trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._trial_running or time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("Highrise API is unavailable, try again shortly")
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class HighriseClient:
+    """Shared keep-alive client for the Highrise chat completions API
+
+    One requests.Session holds a connection pool of `pool_size` connections,
+    so chat turns reuse TCP and TLS connections instead of opening new ones.
+    Every request has connect and read timeouts; for streams the read timeout
+    bounds the wait between chunks. 429 and 5xx answers and connection errors
+    are retried with jittered exponential backoff, honouring Retry-After.
+    Failures that survive the retries trip a CircuitBreaker.
+    """
+
+    def __init__(self, base_url, api_key, pool_size=10, connect_timeout=5, read_timeout=60,
+                 max_retries=3, backoff=0.5, max_backoff=8, breaker=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self._session = requests.Session()
+        # pool_block makes callers beyond pool_size wait for a connection instead of opening throwaway ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+    def _delay(self, attempt, response=None):
+        """Seconds to wait before retry number `attempt` (from 0)"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), self.max_backoff)
+        # Full jitter keeps clients that failed together from retrying together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _post_with_retries(self, payload):
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.api_key}',
+            'Accept': 'text/event-stream',
+        }
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = self._session.post(f"{self.base_url}/chat/completions", json=payload,
+                                              headers=headers, stream=True, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code == 200:
+                    return response
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise HighriseError(f"Server error: {response.status_code} - {response.text[:100]}",
+                                        status=response.status_code)
+                response.close()
+
+            time.sleep(self._delay(attempt, response))
+
+    def _post(self, payload):
+        """POST a chat completion, retrying until a response worth reading arrives
+
+        Raises:
+            CircuitOpenError: The circuit is open
+            HighriseError: The API answered with an error status
+            requests.RequestException: The API could not be reached
+        """
+        self.breaker.before_call()
+        try:
+            response = self._post_with_retries(payload)
+        except HighriseError as e:
+            # Any other error status means the upstream is healthy and rejected the request itself
+            if e.status in RETRY_STATUSES:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        return response
+
+    def stream_chat(self, payload):
+        """Stream a chat completion, yielding content deltas as they arrive
+
+        Sends `payload` with 'stream' set and reads the server-sent events.
+        Servers that ignore 'stream' and return a single JSON body yield its
+        content once. Only the request is retried; once content has been
+        yielded, errors propagate.
+
+        Raises:
+            CircuitOpenError: The circuit is open
+            HighriseError: The API answered with an error status
+            requests.RequestException: The API could not be reached or stalled
+        """
+        with self._post(dict(payload, stream=True)) as response:
+            if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+                yield _content(response.json(), 'message')
+                return
+
+            response.encoding = 'utf-8'
+            done = False
+            # Read on past [DONE] to the end of the body; closing a partly read response drops its connection
+            for line in response.iter_lines(decode_unicode=True):
+                if done or not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    done = True
+                    continue
+                content = _content(json.loads(data), 'delta')
+                if content:
+                    yield content
@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class DedupBackend:
+    """Remembers recently seen message IDs so duplicate deliveries can be dropped"""
+
+    def seen(self, user_id, message_id):
+        """Record a message, returning True if it was already recorded and has not expired"""
+        raise NotImplementedError
+
+
+class MemoryDedupBackend(DedupBackend):
+    """Per-process record of recent (user_id, message_id) pairs, bounded by capacity and TTL
+
+    Entries are kept in insertion order, which with a fixed TTL is also expiry
+    order, so expired entries are dropped from the front as new ones arrive.
+    Past `capacity` the oldest entry is evicted. Both are O(1) amortized.
+    """
+
+    def __init__(self, capacity=10000, ttl=3600):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (user_id, message_id) -> expires_at
+        self._lock = threading.Lock()
+
+    def seen(self, user_id, message_id):
+        key = (user_id, message_id)
+        now = time.monotonic()
+        with self._lock:
+            while self._entries:
+                oldest, expires_at = next(iter(self._entries.items()))
+                if expires_at > now:
+                    break
+                del self._entries[oldest]
+
+            if key in self._entries:
+                return True
+
+            self._entries[key] = now + self.ttl
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            return False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisDedupBackend(DedupBackend):
+    """Message IDs shared by every worker through Redis keys that expire after `ttl`"""
+
+    def __init__(self, url, ttl=3600, prefix='execumate:dedup:'):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("MESSAGE_DEDUP_BACKEND=redis requires the redis package (pip install redis)")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def seen(self, user_id, message_id):
+        # SET NX is atomic, so only the first worker to see a message gets True back
+        created = self._client.set(f"{self.prefix}{user_id}:{message_id}", 1, nx=True, ex=self.ttl)
+        return not created
+
+
+def dedup_from_env():
+    """Create the dedup backend selected by MESSAGE_DEDUP_BACKEND"""
+    backend = os.getenv('MESSAGE_DEDUP_BACKEND', 'memory')
+    ttl = int(os.getenv('MESSAGE_DEDUP_TTL', '3600'))
+    if backend == 'memory':
+        return MemoryDedupBackend(capacity=int(os.getenv('MESSAGE_DEDUP_CAPACITY', '10000')), ttl=ttl)
+    if backend == 'redis':
+        return RedisDedupBackend(os.getenv('REDIS_URL', 'redis://localhost:6379/0'), ttl=ttl)
+    raise ValueError(f"Unknown message dedup backend: {backend}")
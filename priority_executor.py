@@ -0,0 +1,63 @@
+import heapq
+import itertools
+import threading
+
+
+class PriorityExecutor:
+    """Runs submitted calls on a fixed pool of worker threads, lowest priority value first
+
+    The queue is bounded: `submit` refuses work instead of blocking when
+    `max_queue` calls are already waiting, so callers can push back on their
+    clients right away. Calls of equal priority run in submission order.
+    Workers are started on the first submit.
+    """
+
+    def __init__(self, max_workers=8, max_queue=64, thread_name_prefix='priority-worker'):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.thread_name_prefix = thread_name_prefix
+        self._queue = []  # heap of (priority, seq, fn, args, kwargs)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._workers = []
+        self._running = 0
+
+    def submit(self, priority, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)`, returning False if the queue is full"""
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                return False
+            heapq.heappush(self._queue, (priority, next(self._seq), fn, args, kwargs))
+            self._available.notify()
+
+            if not self._workers:
+                for n in range(self.max_workers):
+                    worker = threading.Thread(target=self._run, daemon=True,
+                                              name=f"{self.thread_name_prefix}-{n}")
+                    worker.start()
+                    self._workers.append(worker)
+            return True
+
+    def stats(self):
+        """Return (queued, running) call counts"""
+        with self._lock:
+            return len(self._queue), self._running
+
+    def _run(self):
+        while True:
+            with self._available:
+                while not self._queue:
+                    self._available.wait()
+                _, _, fn, args, kwargs = heapq.heappop(self._queue)
+                self._running += 1
+
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Error in {threading.current_thread().name}: {e}")
+                import traceback
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self._running -= 1
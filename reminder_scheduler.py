@@ -0,0 +1,111 @@
+import heapq
+import itertools
+import threading
+import datetime
+
+
+class ReminderScheduler:
+    """Fires reminders at their due time from a single priority queue
+
+    Reminders are keyed, so scheduling an existing key moves it and a user's
+    reminders can be replaced wholesale when their calendar changes. The
+    worker thread sleeps until the earliest reminder is due and is woken early
+    whenever an earlier one is added. Superseded heap entries are skipped when
+    popped rather than removed in place. Pending keys are also indexed by
+    user, so replacing or cancelling one user's reminders does not scan
+    everyone else's.
+
+    `clock` returns the current time in the same naive timezone as the
+    `fire_at` values, local time by default.
+    """
+
+    def __init__(self, clock=datetime.datetime.now, name='reminder-scheduler'):
+        self.clock = clock
+        self.name = name
+        self._queue = []  # heap of (fire_at, seq, key)
+        self._pending = {}  # key -> (fire_at, seq, user_id, action)
+        self._user_keys = {}  # user_id -> set of pending keys
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker = None
+
+    def schedule(self, key, user_id, fire_at, action):
+        """Run `action()` at `fire_at`, replacing any reminder with the same key"""
+        with self._lock:
+            self._schedule_locked(key, user_id, fire_at, action)
+
+    def _schedule_locked(self, key, user_id, fire_at, action):
+        self._discard_locked(key)
+        seq = next(self._seq)
+        self._pending[key] = (fire_at, seq, user_id, action)
+        self._user_keys.setdefault(user_id, set()).add(key)
+        heapq.heappush(self._queue, (fire_at, seq, key))
+        # Rebuild the heap once superseded entries outnumber live ones, so re-planning cannot grow it without bound
+        if len(self._queue) > 2 * len(self._pending) + 64:
+            self._queue = [(entry[0], entry[1], pending_key) for pending_key, entry in self._pending.items()]
+            heapq.heapify(self._queue)
+        self._wakeup.notify()
+
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, daemon=True, name=self.name)
+            self._worker.start()
+
+    def _discard_locked(self, key):
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        keys = self._user_keys[entry[2]]
+        keys.discard(key)
+        if not keys:
+            del self._user_keys[entry[2]]
+
+    def cancel(self, key):
+        with self._lock:
+            self._discard_locked(key)
+
+    def cancel_user(self, user_id):
+        """Cancel every pending reminder for a user"""
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._discard_locked(key)
+
+    def replace_user(self, user_id, reminders):
+        """Make `reminders` ({key: (fire_at, action)}) the user's only pending reminders"""
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                if key not in reminders:
+                    self._discard_locked(key)
+            for key, (fire_at, action) in reminders.items():
+                self._schedule_locked(key, user_id, fire_at, action)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while True:
+                    if not self._queue:
+                        self._wakeup.wait()
+                        continue
+                    fire_at, seq, key = self._queue[0]
+                    delay = (fire_at - self.clock()).total_seconds()
+                    if delay > 0:
+                        self._wakeup.wait(delay)
+                        continue
+                    heapq.heappop(self._queue)
+                    entry = self._pending.get(key)
+                    # Skip entries that were cancelled or rescheduled
+                    if entry is not None and entry[1] == seq:
+                        self._discard_locked(key)
+                        action = entry[3]
+                        break
+
+            try:
+                action()
+            except Exception as e:
+                print(f"Error running {self.name} task {key}: {e}")
+                import traceback
+                traceback.print_exc()
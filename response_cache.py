@@ -0,0 +1,97 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(text):
+    """Fold case, whitespace and trailing punctuation so near-identical prompts match"""
+    return _WHITESPACE.sub(' ', text).strip().lower().rstrip('?!.')
+
+
+def cache_key(model, params, messages, trailing=3):
+    """Hash of the model, sampling parameters, system prompts and the last `trailing` turns"""
+    system = [message for message in messages if message['role'] == 'system']
+    turns = [message for message in messages if message['role'] != 'system'][-trailing:]
+    material = json.dumps([
+        model,
+        sorted(params.items()),
+        [(message['role'], normalize(message['content'])) for message in system + turns],
+    ])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """LRU cache of LLM replies with a TTL, an entry limit and a size limit
+
+    Entries expire `ttl` seconds after they are stored. When either
+    `max_entries` or `max_bytes` (UTF-8 size of the stored replies) would be
+    exceeded, the least recently used entries are evicted.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=5 * 1024 * 1024, ttl=600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, response, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key):
+        """Return the cached reply for `key`, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key, response):
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, response, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+            }
@@ -0,0 +1,31 @@
+from datetime import date, datetime
+from functools import lru_cache
+
+from dateutil import parser
+
+
+@lru_cache(maxsize=8192)
+def parse_datetime(value):
+    """Parse an RFC3339 timestamp such as Google Calendar's `dateTime`
+
+    Uses `datetime.fromisoformat`, which is several times faster than
+    dateutil, and falls back to dateutil for anything it rejects. Calendars
+    repeat the same timestamps constantly (recurring meetings, the start of
+    one event being the end of another), so results are memoized; datetimes
+    are immutable, which makes sharing them safe.
+    """
+    try:
+        if value[-1:] in ('Z', 'z'):
+            value = value[:-1] + '+00:00'
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value)
+
+
+@lru_cache(maxsize=1024)
+def parse_date(value):
+    """Parse an all-day event's `date` (YYYY-MM-DD)"""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value).date()
@@ -35,12 +35,12 @@ document.addEventListener('DOMContentLoaded', function() {
     const reminderTemplate = document.getElementById('reminder-template');
     const calendarEventTemplate = document.getElementById('calendar-event-template');
     
-    // Socket.io connection
-    const socket = io();
-    
     // User ID (in production, use a real user authentication system)
     const userId = 'default_user';
     
+    // Socket.io connection; the user ID marks the user active for calendar reminders
+    const socket = io({ query: { user_id: userId } });
+    
     // Calendar state
     let calendarConnected = false;
     let calendarData = null;
@@ -203,6 +203,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Add click handlers for the buttons
         card1.querySelector('button').addEventListener('click', () => {
             socket.emit('order', {
+                user_id: userId,
                 url: items[0].url,
                 item_name: items[0].item_name,
                 restaurant_url: items[0].restaurant_url
@@ -211,6 +212,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
         card2.querySelector('button').addEventListener('click', () => {
             socket.emit('order', {
+                user_id: userId,
                 url: items[1].url,
                 item_name: items[1].item_name,
                 restaurant_url: items[1].restaurant_url
@@ -273,10 +275,43 @@ document.addEventListener('DOMContentLoaded', function() {
     // Set to track processed message IDs to prevent duplicates
     const processedMessageIds = new Set();
     
+    // Assistant messages still being streamed, by message ID
+    const streamingMessages = new Map();
+    
+    socket.on('response_chunk', function(data) {
+        if (data.user_id !== userId || processedMessageIds.has(data.message_id)) {
+            return;
+        }
+        
+        let paragraph = streamingMessages.get(data.message_id);
+        if (!paragraph) {
+            // First chunk replaces the typing indicator with a message that grows in place
+            const typingIndicator = document.querySelector('.typing');
+            if (typingIndicator) {
+                typingIndicator.remove();
+            }
+            paragraph = addMessage('assistant', '');
+            streamingMessages.set(data.message_id, paragraph);
+        }
+        
+        paragraph.textContent += data.chunk;
+        scrollToBottom();
+    });
+    
     socket.on('response', function(data) {
         console.log('Received response:', data);
         
         if (data.user_id === userId) {
+            // The complete text of a streamed message replaces what was assembled from chunks
+            const streamed = streamingMessages.get(data.message_id);
+            if (streamed) {
+                streamingMessages.delete(data.message_id);
+                processedMessageIds.add(data.message_id);
+                streamed.textContent = data.response;
+                scrollToBottom();
+                return;
+            }
+            
             // Check if this is a message with an ID we can track
             if (data.message_id) {
                 // If we've already processed this exact message ID, ignore it
@@ -316,6 +351,27 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    // One assistant message per order, updated as the order job progresses
+    const orderMessages = new Map();
+    
+    socket.on('order_status', function(data) {
+        if (data.user_id !== userId) {
+            return;
+        }
+        
+        let paragraph = orderMessages.get(data.job_id);
+        if (!paragraph) {
+            paragraph = addMessage('assistant', '');
+            orderMessages.set(data.job_id, paragraph);
+        }
+        paragraph.textContent = data.message;
+        
+        if (data.status === 'succeeded' || data.status === 'failed') {
+            orderMessages.delete(data.job_id);
+        }
+        scrollToBottom();
+    });
+    
     socket.on('reminder', function(data) {
         if (data.user_id === userId) {
             addReminder(data.message, data.event);
@@ -362,13 +418,16 @@ document.addEventListener('DOMContentLoaded', function() {
         const messageElement = document.importNode(template.content, true);
         
         // Set message content
-        messageElement.querySelector('p').textContent = content;
+        const paragraph = messageElement.querySelector('p');
+        paragraph.textContent = content;
         
         // Add to chat
         messagesContainer.appendChild(messageElement);
         
         // Scroll to bottom
         scrollToBottom();
+        
+        return paragraph;
     }
     
     function addTypingIndicator() {
@@ -406,10 +465,12 @@ document.addEventListener('DOMContentLoaded', function() {
             // Show typing indicator
             addTypingIndicator();
             
-            // Send message to server
+            // Send message to server; reminder replies are answered ahead of regular chat
             socket.emit('message', {
                 message: orderMessage,
-                user_id: userId
+                user_id: userId,
+                message_id: generateUniqueId(),
+                source: 'reminder'
             });
         });
         